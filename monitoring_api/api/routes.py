@@ -1,25 +1,25 @@
 #!/usr/bin/python3
 
+import json
+import time
 import traceback
-from slowapi import Limiter
-from slowapi.util import get_remote_address
-from slowapi.errors import RateLimitExceeded
-from fastapi import APIRouter, Depends, Request, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, Depends, Request, Response, HTTPException, Query
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.security import OAuth2PasswordRequestForm
 from datetime import timedelta
-from typing import Dict
-from auth import authenticate_user, create_access_token, get_current_user
-from services.monitoring import (
-    check_ip,
-    check_disk,
-    check_apt_updates,
-    check_load,
-    check_memory,
-    check_logged_in_users,
-    check_processes,
-    check_plex
-)
+from typing import Any, AsyncIterator, Dict, List, Optional, Set
+from auth import authenticate_user, create_access_token, get_current_user, get_metrics_user, get_stream_user, verify_tautulli_webhook
+from services.monitoring import check_plex
+from services.collector import MODELS, collector, Sample
+from services.executor import password_executor, probe_executor
+from services.fleet import fleet
+from services.plex import plex_sessions
+from services.history import history
+from services.stream import broadcaster
+from services.encoding import FastJSONResponse, TimedJSONResponse, dumps, encoded_cache, loads
+from services.ratelimit import RateLimitExceeded, client_ip, limiter
+from services.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, metrics_exporter
+from services.timings import timings
 from services.models import (
     MonitoringStatus,
     IPStatus,
@@ -29,44 +29,91 @@ from services.models import (
     MemoryStatus,
     LoggedInUsersStatus,
     ProcessStatus,
-    PlexStatus
+    PlexStatus,
+    HistoryResponse,
+    STATUS_SECTIONS
 )
 from config import config
 from services.logger import logger
 
-# Create default value
-rate_limit = f"{str(config.api_rate_limit)}/second"
+# Init router, routes are rate limited per client and user by the shared limiter
+router = APIRouter(default_response_class=TimedJSONResponse)
+
+# Routes served outside the /api prefix
+metrics_router = APIRouter()
+
+# Optional query parameter to force a fresh sample when the cached one is too old
+MaxAge = Query(None, ge=0, description="Maximum age in seconds of the returned sample")
 
-# Init router with rate limiter
-router = APIRouter()
-limiter = Limiter(key_func=get_remote_address)
+# Check and model of each section of MonitoringStatus, for the ?checks= and ?fields= selectors
+STATUS_SECTIONS_BY_FIELD = {field: name for name, field in STATUS_SECTIONS.items()}
+SECTION_MODELS = {field: MODELS[name] for name, field in STATUS_SECTIONS.items()}
 
 
 async def rate_limit_exceeded_handler(request: Request, exc: RateLimitExceeded) -> JSONResponse:
     """Custom 429 Error Response"""
-    logger.warning(f"Rate limit exceeded: {request.client.host} for {request.url}")
+    logger.warning(f"Rate limit exceeded: {client_ip(request)} for {request.url}")
     return JSONResponse(
         status_code=429,
-        content={"detail": "Too many requests, slow down!"}
+        content={"detail": "Too many requests, slow down!"},
+        headers={"Retry-After": str(max(1, round(exc.retry_after)))}
     )
 
 
+def conditional_response(request: Request, response: Response, samples: Dict[str, Sample], max_age: Optional[int] = None) -> Optional[Response]:
+    """
+    Set a strong ETag and Cache-Control for snapshot samples and return a 304
+    response when the client already has this version. Samples that are not
+    part of the snapshot (timed out) or hold an error are never cached.
+    max_age defaults to the time until the collector samples the checks again.
+    """
+    if any(sample.version == 0 or sample.value.error is not None for sample in samples.values()):
+        response.headers["Cache-Control"] = "no-cache"
+        return None
+
+    # Versions only ever increase, so the newest one identifies the whole set
+    etag = f'"{max(sample.version for sample in samples.values())}"'
+    if max_age is None:
+        max_age = min(collector.remaining(sample, name) for name, sample in samples.items())
+    headers = {"ETag": etag, "Cache-Control": f"private, max-age={max_age}"}
+
+    if_none_match = request.headers.get("If-None-Match", "")
+    if if_none_match.strip() == "*" or etag in (tag.strip() for tag in if_none_match.split(",")):
+        return Response(status_code=304, headers=headers)
+
+    response.headers.update(headers)
+    return None
+
+
+async def read_status(request: Request, response: Response, name: str, max_age: Optional[float]) -> Any:
+    """Read one check from the collector and answer conditional requests for it."""
+    sample = await collector.read(name, max_age)
+    not_modified = conditional_response(request, response, {name: sample})
+    if not_modified:
+        return not_modified
+
+    if config.fast_json:
+        body = encoded_cache.get(name, sample.version, lambda: sample.value)
+        return FastJSONResponse(body, headers=dict(response.headers))
+    return sample.value
+
+
 @router.get("/")
 async def root() -> Dict[str, str]:
     """Default root path"""
-    logger.info(f"User requested root path")
+    logger.debug(f"User requested root path")
     return {"message": "Server Monitoring API is running"}
 
 
 @router.post("/auth/token")
-@limiter.limit(rate_limit)
+@limiter.limit
 async def login_for_access_token(request: Request, form_data: OAuth2PasswordRequestForm = Depends()) -> Dict[str, str]:
     """Authenticate user and return a JWT access token."""
     logger.info(f"Login attempt for user: {form_data.username}")
 
     try:
         # Authenticate user
-        user = authenticate_user(form_data.username, form_data.password)
+        user = await authenticate_user(form_data.username, form_data.password, client_ip(request))
 
         # Create access token
         access_token_expires = timedelta(minutes=int(config.oauth_token_expire))
@@ -88,84 +135,324 @@ async def login_for_access_token(request: Request, form_data: OAuth2PasswordRequ
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
-@router.get("/status/all", response_model=MonitoringStatus, dependencies=[Depends(get_current_user)])
-@limiter.limit(rate_limit)
-async def get_status(request: Request, user: dict = Depends(get_current_user)) -> MonitoringStatus:
-    """Return all system status in structured format."""
-
-    checks = MonitoringStatus(
-        public_ip=await check_ip(),
-        disk_space=await check_disk(),
-        apt_updates=await check_apt_updates(),
-        load_status=await check_load(),
-        memory_status=await check_memory(),
-        logged_in_user_status=await check_logged_in_users(),
-        process_status=await check_processes()
-    )
-
-    logger.info(f"User {user['username']} requested all system status")
-    return checks
-
-
-@router.get("/status/ip", response_model=IPStatus, dependencies=[Depends(get_current_user)])
-@limiter.limit(rate_limit)
-async def get_ip(request: Request, user: dict = Depends(get_current_user)) -> IPStatus:
+def parse_checks(checks: Optional[str]) -> Optional[List[str]]:
+    """Parse the ?checks= selector into check names, None selects all checks."""
+    if checks is None:
+        return None
+    names = [name.strip() for name in checks.split(",") if name.strip()]
+    if not names:
+        raise HTTPException(status_code=400, detail="No checks selected")
+    unknown = [name for name in names if name not in STATUS_SECTIONS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown checks: {','.join(unknown)}, choose from {','.join(STATUS_SECTIONS)}")
+    # Keep the order of the response stable whatever the order of the selector
+    return [name for name in STATUS_SECTIONS if name in names]
+
+
+def parse_fields(fields: Optional[str]) -> Optional[Dict[str, Optional[Set[str]]]]:
+    """
+    Parse the ?fields= projection into top level keys, each with the set of its
+    own keys to keep (from section.key items) or None to keep it whole.
+    """
+    if fields is None:
+        return None
+    projection: Dict[str, Optional[Set[str]]] = {}
+    for item in (item.strip() for item in fields.split(",")):
+        if not item:
+            continue
+        name, _, key = item.partition(".")
+        field = MonitoringStatus.model_fields.get(name)
+        if field is None:
+            raise HTTPException(status_code=400, detail=f"Unknown field: {name}")
+        if not key:
+            projection[name] = None
+            continue
+        section = SECTION_MODELS.get(name)
+        if section is None or key not in section.model_fields:
+            raise HTTPException(status_code=400, detail=f"Unknown field: {item}")
+        if name not in projection or projection[name] is not None:
+            projection.setdefault(name, set()).add(key)
+    if not projection:
+        raise HTTPException(status_code=400, detail="No fields selected")
+    return projection
+
+
+def project(status: MonitoringStatus, projection: Dict[str, Optional[Set[str]]]) -> Dict[str, Any]:
+    """Keep only the projected keys of a status."""
+    result = {}
+    for name, keys in projection.items():
+        value = getattr(status, name)
+        result[name] = value if keys is None or value is None else {key: getattr(value, key) for key in keys}
+    return result
+
+
+@router.get("/status/all", response_model=MonitoringStatus)
+@limiter.limit
+async def get_status(
+    request: Request,
+    response: Response,
+    max_age: Optional[float] = MaxAge,
+    checks: Optional[str] = Query(None, description=f"Comma-separated checks to include, from {','.join(STATUS_SECTIONS)} (default: all)"),
+    fields: Optional[str] = Query(None, description="Comma-separated keys to return, a section or section.key (default: all)"),
+    user: dict = Depends(get_current_user)
+) -> MonitoringStatus:
+    """Return all system status in structured format, or only the selected checks and fields."""
+    names = parse_checks(checks)
+    projection = parse_fields(fields)
+    if names is None:
+        # Without a check selector only the checks of the projected sections are read
+        sections = {STATUS_SECTIONS_BY_FIELD[name] for name in projection or () if name in STATUS_SECTIONS_BY_FIELD}
+        names = [name for name in STATUS_SECTIONS if name in sections] or list(STATUS_SECTIONS)
+
+    samples = await collector.read_many(names, max_age)
+    not_modified = conditional_response(request, response, samples)
+    if not_modified:
+        return not_modified
+
+    def build() -> MonitoringStatus:
+        values = {name: sample.value for name, sample in samples.items()}
+        sampled = [value for value in values.values() if value.sampled_at is not None]
+        # The sections are already validated, the fast path skips validating them again
+        model = MonitoringStatus.model_construct if config.fast_json or projection else MonitoringStatus
+        return model(
+            **{STATUS_SECTIONS[name]: value for name, value in values.items()},
+            # The overall sample is as old as its oldest section
+            sampled_at=min((value.sampled_at for value in sampled), default=None),
+            collect_ms=max((value.collect_ms for value in sampled), default=None),
+            timed_out=any(value.timed_out for value in values.values()),
+            error=None
+        )
+
+    logger.debug(f"User {user['username']} requested system status of {','.join(names)}")
+    if projection:
+        return FastJSONResponse(project(build(), projection), headers=dict(response.headers))
+    if config.fast_json:
+        version = 0 if any(sample.version == 0 for sample in samples.values()) else max(sample.version for sample in samples.values())
+        return FastJSONResponse(encoded_cache.get(f"all:{','.join(names)}", version, build), headers=dict(response.headers))
+    return build()
+
+
+@router.get("/status/ip", response_model=IPStatus)
+@limiter.limit
+async def get_ip(request: Request, response: Response, max_age: Optional[float] = MaxAge, user: dict = Depends(get_current_user)) -> IPStatus:
     """Return ip check in structured format."""
-    logger.info(f"User {user['username']} requested IP check")
-    return await check_ip()
+    logger.debug(f"User {user['username']} requested IP check")
+    return await read_status(request, response, "ip", max_age)
 
 
-@router.get("/status/disk", response_model=DiskSpaceStatus, dependencies=[Depends(get_current_user)])
-@limiter.limit(rate_limit)
-async def get_disk(request: Request, user: dict = Depends(get_current_user)) -> DiskSpaceStatus:
+@router.get("/status/disk", response_model=DiskSpaceStatus)
+@limiter.limit
+async def get_disk(request: Request, response: Response, max_age: Optional[float] = MaxAge, user: dict = Depends(get_current_user)) -> DiskSpaceStatus:
     """Return disk check in structured format."""
-    logger.info(f"User {user['username']} requested disk check")
-    return await check_disk()
+    logger.debug(f"User {user['username']} requested disk check")
+    return await read_status(request, response, "disk", max_age)
 
 
-@router.get("/status/apt", response_model=AptUpdateStatus, dependencies=[Depends(get_current_user)])
-@limiter.limit(rate_limit)
-async def get_apt(request: Request, user: dict = Depends(get_current_user)) -> AptUpdateStatus:
+@router.get("/status/apt", response_model=AptUpdateStatus)
+@limiter.limit
+async def get_apt(request: Request, response: Response, max_age: Optional[float] = MaxAge, user: dict = Depends(get_current_user)) -> AptUpdateStatus:
     """Return disk check in structured format."""
-    logger.info(f"User {user['username']} requested APT check")
-    return await check_apt_updates()
+    logger.debug(f"User {user['username']} requested APT check")
+    return await read_status(request, response, "apt", max_age)
 
 
-@router.get("/status/load", response_model=LoadStatus, dependencies=[Depends(get_current_user)])
-@limiter.limit(rate_limit)
-async def get_load(request: Request, user: dict = Depends(get_current_user)) -> LoadStatus:
+@router.get("/status/load", response_model=LoadStatus)
+@limiter.limit
+async def get_load(request: Request, response: Response, max_age: Optional[float] = MaxAge, user: dict = Depends(get_current_user)) -> LoadStatus:
     """Return system load status."""
-    logger.info(f"User {user['username']} requested load status")
-    return await check_load()
+    logger.debug(f"User {user['username']} requested load status")
+    return await read_status(request, response, "load", max_age)
 
 
-@router.get("/status/memory", response_model=MemoryStatus, dependencies=[Depends(get_current_user)])
-@limiter.limit(rate_limit)
-async def get_memory(request: Request, user: dict = Depends(get_current_user)) -> MemoryStatus:
+@router.get("/status/memory", response_model=MemoryStatus)
+@limiter.limit
+async def get_memory(request: Request, response: Response, max_age: Optional[float] = MaxAge, user: dict = Depends(get_current_user)) -> MemoryStatus:
     """Return system memory status."""
-    logger.info(f"User {user['username']} requested memory status")
-    return await check_memory()
+    logger.debug(f"User {user['username']} requested memory status")
+    return await read_status(request, response, "memory", max_age)
 
 
-@router.get("/status/users", response_model=LoggedInUsersStatus, dependencies=[Depends(get_current_user)])
-@limiter.limit(rate_limit)
-async def get_logged_in_users_status(request: Request, user: dict = Depends(get_current_user)) -> LoggedInUsersStatus:
+@router.get("/status/users", response_model=LoggedInUsersStatus)
+@limiter.limit
+async def get_logged_in_users_status(request: Request, response: Response, max_age: Optional[float] = MaxAge, user: dict = Depends(get_current_user)) -> LoggedInUsersStatus:
     """Return the number of logged-in users."""
-    logger.info(f"User {user['username']} requested logged-in user status")
-    return await check_logged_in_users()
+    logger.debug(f"User {user['username']} requested logged-in user status")
+    return await read_status(request, response, "users", max_age)
 
 
-@router.get("/status/processes", response_model=ProcessStatus, dependencies=[Depends(get_current_user)])
-@limiter.limit(rate_limit)
-async def get_process_status(request: Request, user: dict = Depends(get_current_user)) -> ProcessStatus:
+@router.get("/status/processes", response_model=ProcessStatus)
+@limiter.limit
+async def get_process_status(request: Request, response: Response, max_age: Optional[float] = MaxAge, user: dict = Depends(get_current_user)) -> ProcessStatus:
     """Return process status for monitored processes."""
-    logger.info(f"User {user['username']} requested process status")
-    return await check_processes()
-
-
-@router.get("/status/plex", response_model=PlexStatus, dependencies=[Depends(get_current_user)])
-@limiter.limit(rate_limit)
-async def get_plex_status(request: Request, user: dict = Depends(get_current_user)) -> PlexStatus:
+    logger.debug(f"User {user['username']} requested process status")
+    return await read_status(request, response, "processes", max_age)
+
+
+@router.get("/status/plex", response_model=PlexStatus)
+@limiter.limit
+async def get_plex_status(
+    request: Request,
+    response: Response,
+    max_age: Optional[float] = MaxAge,
+    raw: bool = Query(False, description="Also return the untrimmed Tautulli get_activity response"),
+    user: dict = Depends(get_current_user)
+) -> PlexStatus:
     """Return stream status for plex."""
-    logger.info(f"User {user['username']} requested plex status")
-    return await check_plex()
+    logger.debug(f"User {user['username']} requested plex status")
+    if raw:
+        # The raw Tautulli response is for debugging and never cached by clients
+        response.headers["Cache-Control"] = "no-cache"
+        status = await check_plex.cache.get(max_age)
+        return FastJSONResponse(dumps(status), headers=dict(response.headers)) if config.fast_json else status
+
+    # The live session table needs no call to Tautulli, it changes with every webhook so clients revalidate
+    if plex_sessions.enabled:
+        status = plex_sessions.status()
+        key, version, cache_age = "plex:table", plex_sessions.version, 0
+    else:
+        status = (await check_plex.cache.get(max_age)).model_copy(update={"plex": None})
+        # Each worker has its own cache, the sample time tells their values apart
+        version = int(status.sampled_at * 1e6) if status.sampled_at else 0
+        key, cache_age = "plex", check_plex.cache.remaining()
+
+    sample = Sample(value=status, sampled_at=status.sampled_at, collect_ms=status.collect_ms, version=version)
+    not_modified = conditional_response(request, response, {"plex": sample}, max_age=cache_age)
+    if not_modified:
+        return not_modified
+    if config.fast_json:
+        return FastJSONResponse(encoded_cache.get(key, version, lambda: status), headers=dict(response.headers))
+    return status
+
+
+@router.post("/webhooks/tautulli", dependencies=[Depends(verify_tautulli_webhook)])
+async def tautulli_webhook(request: Request) -> Dict[str, Any]:
+    """Apply a Tautulli notification (play, stop, pause, resume, buffer, transcode) to the live Plex session table."""
+    if not plex_sessions.enabled:
+        raise HTTPException(status_code=404, detail="Tautulli webhooks are not enabled")
+    try:
+        event = loads(await request.body())
+        if not isinstance(event, dict):
+            raise ValueError("Event is not a JSON object")
+        action = plex_sessions.apply(event)
+    except ValueError as e:
+        logger.warning(f"Rejected Tautulli webhook: {e}")
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"action": action, "stream_count": len(plex_sessions.sessions)}
+
+
+@router.get("/debug/probes")
+@limiter.limit
+async def get_probe_stats(request: Request, user: dict = Depends(get_current_user)) -> Dict[str, Dict[str, Any]]:
+    """Return how long each blocking probe waited for and held a worker thread."""
+    logger.debug(f"User {user['username']} requested probe stats")
+    return probe_executor.snapshot()
+
+
+@router.get("/debug/logins")
+@limiter.limit
+async def get_login_stats(request: Request, user: dict = Depends(get_current_user)) -> Dict[str, Dict[str, Dict[str, Any]]]:
+    """Return login latency per outcome and the state of the bcrypt executor."""
+    logger.debug(f"User {user['username']} requested login stats")
+    return {"logins": timings.snapshot("login."), "bcrypt": password_executor.snapshot()}
+
+
+@router.get("/debug/timings")
+@limiter.limit
+async def get_timings(request: Request, user: dict = Depends(get_current_user)) -> Dict[str, Dict[str, Any]]:
+    """Return the latency histograms of checks, authentication, logins and JSON encoding."""
+    logger.debug(f"User {user['username']} requested timings")
+    return timings.snapshot()
+
+
+@router.get("/fleet/status")
+@limiter.limit
+async def get_fleet_status(request: Request, user: dict = Depends(get_current_user)) -> FastJSONResponse:
+    """Return the last status of every fleet node, nodes without a recent poll are marked stale."""
+    if not fleet.enabled:
+        raise HTTPException(status_code=404, detail="Fleet mode is not enabled")
+    logger.debug(f"User {user['username']} requested fleet status")
+    fleet.sync()
+    return FastJSONResponse(fleet.view())
+
+
+@router.get("/fleet/status/{host}")
+@limiter.limit
+async def get_fleet_node_status(request: Request, host: str, user: dict = Depends(get_current_user)) -> FastJSONResponse:
+    """Return the last status of one fleet node."""
+    node = fleet.nodes.get(host)
+    if node is None:
+        raise HTTPException(status_code=404, detail=f"Unknown fleet node: {host}")
+    logger.debug(f"User {user['username']} requested fleet status of {host}")
+    fleet.sync()
+    return FastJSONResponse(fleet.node_view(node))
+
+
+@router.get("/history")
+@limiter.limit
+async def get_history_metrics(request: Request, user: dict = Depends(get_current_user)) -> List[str]:
+    """Return the names of all metrics with history."""
+    logger.debug(f"User {user['username']} requested history metrics")
+    return await history.metrics()
+
+
+@router.get("/history/{metric:path}", response_model=HistoryResponse)
+@limiter.limit
+async def get_history(
+    request: Request,
+    metric: str,
+    from_: Optional[float] = Query(None, alias="from", description="Start as unix time (default: one hour ago)"),
+    to: Optional[float] = Query(None, description="End as unix time (default: now)"),
+    step: Optional[int] = Query(None, gt=0, description="Bucket size in seconds (default: picked from the range)"),
+    user: dict = Depends(get_current_user)
+) -> HistoryResponse:
+    """Return min/max/avg points of a metric over a time range."""
+    end = to if to is not None else time.time()
+    start = from_ if from_ is not None else end - 3600
+    if start >= end:
+        raise HTTPException(status_code=400, detail="'from' must be before 'to'")
+
+    logger.debug(f"User {user['username']} requested history for {metric}")
+    return await history.query(metric, start, end, step)
+
+
+@router.get("/stream")
+@limiter.limit
+async def get_stream(
+    request: Request,
+    last_event_id: Optional[int] = Query(None, description="Resume after this sequence number, the Last-Event-ID header takes precedence"),
+    user: dict = Depends(get_stream_user)
+) -> StreamingResponse:
+    """Push changed status fields as Server-Sent Events, authenticated once at connect."""
+    header_id = request.headers.get("Last-Event-ID")
+    if header_id and header_id.isdigit():
+        last_event_id = int(header_id)
+
+    logger.info(f"User {user['username']} opened a status stream (last event: {last_event_id})")
+    subscriber = broadcaster.subscribe(last_event_id)
+
+    async def events() -> AsyncIterator[str]:
+        try:
+            while True:
+                # End the stream when the token expires, the client reconnects with a new one
+                if user.get("exp") and time.time() >= user["exp"]:
+                    yield "event: expired\ndata: {}\n\n"
+                    return
+                if await request.is_disconnected():
+                    return
+
+                batch = await subscriber.next(float(config.stream_keepalive))
+                if not batch:
+                    yield ": keepalive\n\n"
+                for seq, event, data in batch:
+                    yield f"id: {seq}\nevent: {event}\ndata: {json.dumps(data)}\n\n"
+        finally:
+            broadcaster.unsubscribe(subscriber)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@metrics_router.get("/metrics")
+@limiter.limit
+async def get_metrics(request: Request, user: Optional[dict] = Depends(get_metrics_user)) -> Response:
+    """Return every check of the collector snapshot in the OpenMetrics text format."""
+    return Response(content=metrics_exporter.render(), media_type=METRICS_CONTENT_TYPE)
@@ -1,15 +1,21 @@
 #!/usr/bin/python3
 
+import hmac
 import time
-from cachetools import TTLCache
+import hashlib
+import threading
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from fastapi import Depends, HTTPException
+from fastapi import Depends, HTTPException, Query, Request
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from config import config
-from typing import Dict, Optional, Any
+from typing import Dict, Optional, Any, Tuple
 from services.logger import logger
 from services.db import get_user, verify_password
+from services.executor import ExecutorFull, password_executor
+from services.ratelimit import client_ip, login_throttle
+from services.timings import timings
 
 # Load configuration values for authentication
 SECRET_KEY = config.oauth_secret_key
@@ -17,44 +23,86 @@ ALGORITHM = config.oauth_algorithm
 FAILED_ATTEMPT_LIMIT = int(config.failed_attempt_limit)
 BLOCK_TIME_MINUTES = int(config.block_time_minutes)
 
-# Cache to store failed login attempts with time-to-live (TTL) expiry
-failed_login_cache = TTLCache(maxsize=1000, ttl=BLOCK_TIME_MINUTES * 60)
-
 # OAuth2 bearer token setup for authentication
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/token")
 
 
-def is_user_blocked(username: str) -> bool:
+class TokenCache:
     """
-    Check if a user is temporarily blocked due to excessive failed login attempts.
-    Returns True if the user is still in the blocked period, otherwise False.
+    Bounded LRU of verified tokens keyed by the token digest, so a token is
+    only decoded once until it expires. Reads never wait for the lock, the
+    recency update is skipped when another writer holds it.
     """
-    block_time = failed_login_cache.get(username)
 
-    if isinstance(block_time, (int, float)) and block_time > time.time():
-        remaining_time = int(block_time - time.time())
-        logger.warning(f"User {username} is temporarily blocked ({remaining_time} seconds remaining)")
-        return True
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[bytes, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(token: str) -> bytes:
+        """Return the digest a token is stored under."""
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, key: bytes) -> Optional[Dict[str, Any]]:
+        """Return the verified user of a token digest, or None when it is unknown or expired."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires, user = entry
+        if expires <= time.time():
+            return None
+        if self._lock.acquire(blocking=False):
+            try:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+            finally:
+                self._lock.release()
+        return user
+
+    def put(self, key: bytes, user: Dict[str, Any]) -> None:
+        """Store a verified user until the expiry of its token, evicting the least recently used entry."""
+        if not user.get("exp") or self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (float(user["exp"]), user)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+
+# Cache of tokens that passed verification
+token_cache = TokenCache(int(config.token_cache_size))
+
+
+def is_user_blocked(username: str, ip: str) -> bool:
+    """
+    Check if a user or client address is temporarily blocked due to excessive failed login attempts.
+    Returns True if either is still in the blocked period, otherwise False.
+    """
+    for key in (f"login-user:{username}", f"login-ip:{ip}"):
+        remaining_time = login_throttle.blocked(key)
+        if remaining_time > 0:
+            logger.warning(f"Login for user {username} from {ip} is temporarily blocked ({int(remaining_time)} seconds remaining)")
+            return True
 
     return False
 
 
-def register_failed_login(username: str) -> None:
+def register_failed_login(username: Optional[str], ip: str) -> None:
     """
-    Register a failed login attempt. If the number of failed attempts exceeds
-    the limit, block the user for a defined time period.
+    Register a failed login attempt for the user (when it exists) and the
+    client address. Once the number of failed attempts in the window reaches
+    the limit, they are blocked for a defined time period.
     """
     try:
-        attempts = failed_login_cache.get(username, 0) + 1
-
-        if attempts >= FAILED_ATTEMPT_LIMIT:
-            # Block user by setting a timestamp for the block period
-            failed_login_cache[username] = time.time() + \
-                (BLOCK_TIME_MINUTES * 60)
-            logger.warning(f"User {username} blocked for {BLOCK_TIME_MINUTES} minutes due to excessive failed logins")
-        else:
-            failed_login_cache[username] = attempts
-            logger.warning(f"Failed login attempt {attempts}/{FAILED_ATTEMPT_LIMIT} for user: {username}")
+        keys = [f"login-ip:{ip}"] + ([f"login-user:{username}"] if username else [])
+        for key in keys:
+            attempts, blocked_for = login_throttle.fail(key)
+            if blocked_for > 0:
+                logger.warning(f"{key} blocked for {BLOCK_TIME_MINUTES} minutes due to excessive failed logins")
+            else:
+                logger.warning(f"Failed login attempt {attempts}/{FAILED_ATTEMPT_LIMIT} for {key}")
     except Exception as e:
         logger.error(f"Error tracking failed login for user {username}: {str(e)}")
 
@@ -77,11 +125,17 @@ def create_access_token(data: Dict[str, Any], expires_delta: Optional[timedelta]
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
-def verify_access_token(token: str) -> Dict[str, str]:
+def verify_access_token(token: str) -> Dict[str, Any]:
     """
     Decode and verify the validity of a JWT access token.
     Returns the payload if valid, otherwise raises an authentication error.
+    Tokens that were verified before are answered from the token cache.
     """
+    key = TokenCache.key(token)
+    user = token_cache.get(key)
+    if user is not None:
+        return user
+
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         # Extract username from token
@@ -92,8 +146,10 @@ def verify_access_token(token: str) -> Dict[str, str]:
                 "Token verification failed: No username found in payload")
             raise HTTPException(status_code=401, detail="Invalid token")
 
-        logger.info(f"Token verified successfully for user: {username}")
-        return {"username": username}
+        logger.debug(f"Token verified successfully for user: {username}")
+        user = {"username": username, "exp": payload.get("exp")}
+        token_cache.put(key, user)
+        return user
 
     except JWTError as e:
         logger.warning(f"Invalid token attempt: {e}")
@@ -104,34 +160,50 @@ def verify_access_token(token: str) -> Dict[str, str]:
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
-def authenticate_user(username: str, password: str) -> Dict[str, str]:
+async def authenticate_user(username: str, password: str, ip: str) -> Dict[str, str]:
     """
     Authenticate a user by checking the provided username and password.
-    If authentication succeeds, return user details.
+    If authentication succeeds, return user details. Failed attempts are
+    throttled per user and per client address, and the bcrypt check runs on
+    the password executor, a 503 is returned when its queue is full.
     """
+    start = time.perf_counter()
+    outcome = "error"
+
     # Fetch user details from the database
     user = get_user(username)
 
     try:
+        if is_user_blocked(username, ip):
+            raise HTTPException(status_code=403, detail=f"Too many failed attempts. Try again in {BLOCK_TIME_MINUTES} minutes")
+
         if not user:
+            register_failed_login(None, ip)
             logger.warning(f"Login failed for non-existent user: {username}")
             raise HTTPException(status_code=401, detail="Invalid credentials")
 
-        if is_user_blocked(username):
-            raise HTTPException(status_code=403, detail=f"Too many failed attempts. Try again in {BLOCK_TIME_MINUTES} minutes")
+        try:
+            valid = await password_executor.run("verify", verify_password, password, user["hashed_password"])
+        except ExecutorFull as e:
+            outcome = "rejected"
+            logger.warning(f"Login for user {username} rejected, password executor is full ({e})")
+            raise HTTPException(status_code=503, detail="Too many concurrent logins, try again later", headers={"Retry-After": "1"})
 
-        if not verify_password(password, user["hashed_password"]):
+        if not valid:
+            register_failed_login(username, ip)
             logger.warning(f"Invalid password attempt for user: {username}")
             raise HTTPException(status_code=401, detail="Invalid credentials")
 
-        # Reset failed attempts after a successful login
-        if username in failed_login_cache:
-            del failed_login_cache[username]
+        # Reset failed attempts of the user after a successful login
+        login_throttle.reset(f"login-user:{username}")
 
+        outcome = "success"
         logger.info(f"User {username} authenticated successfully")
         return {"username": username}
 
     except HTTPException as e:
+        if e.status_code in (401, 403):
+            outcome = "failed"
         logger.warning(f"Authentication failed for user {username}: {e.detail}")
         raise e
 
@@ -139,12 +211,17 @@ def authenticate_user(username: str, password: str) -> Dict[str, str]:
         logger.error(f"Unexpected error during authentication for user {username}: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
+    finally:
+        timings.record(f"login.{outcome}", (time.perf_counter() - start) * 1000, outcome == "error")
+
 
 async def get_current_user(token: str = Depends(oauth2_scheme)) -> Dict[str, str]:
     """
     Retrieve the currently authenticated user based on the provided OAuth2 token.
     """
-    logger.info("Received authentication request using OAuth2 token")
+    logger.debug("Received authentication request using OAuth2 token")
+    start = time.perf_counter()
+    failed = True
 
     try:
         # Validate token and extract user info
@@ -156,7 +233,8 @@ async def get_current_user(token: str = Depends(oauth2_scheme)) -> Dict[str, str
             raise HTTPException(
                 status_code=401, detail="Invalid authentication credentials")
 
-        logger.info(f"Authenticated user: {user['username']}")
+        logger.debug(f"Authenticated user: {user['username']}")
+        failed = False
         return user
 
     except JWTError as e:
@@ -170,3 +248,49 @@ async def get_current_user(token: str = Depends(oauth2_scheme)) -> Dict[str, str
     except Exception as e:
         logger.error(f"Unexpected error during authentication: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal server error")
+
+    finally:
+        timings.record("auth", (time.perf_counter() - start) * 1000, failed)
+
+
+async def verify_tautulli_webhook(request: Request, secret: Optional[str] = Query(None, description="Webhook secret for senders that can not set headers")) -> None:
+    """
+    Check the shared secret of a Tautulli webhook, from the X-Webhook-Secret
+    header or the secret query parameter. Wrong secrets count as failed logins
+    of the client address, so guessing gets the address blocked.
+    """
+    ip = client_ip(request)
+    if login_throttle.blocked(f"login-ip:{ip}") > 0:
+        raise HTTPException(status_code=403, detail=f"Too many failed attempts. Try again in {BLOCK_TIME_MINUTES} minutes")
+
+    given = request.headers.get("X-Webhook-Secret") or secret or ""
+    if not config.tautulli_webhook_secret or not hmac.compare_digest(given.encode(), config.tautulli_webhook_secret.encode()):
+        register_failed_login(None, ip)
+        logger.warning(f"Tautulli webhook from {ip} with an invalid secret")
+        raise HTTPException(status_code=401, detail="Invalid webhook secret")
+
+
+async def get_metrics_user(request: Request) -> Optional[Dict[str, Any]]:
+    """
+    Authenticate a metrics scrape with a bearer token, unless the metrics are
+    public (METRICS_PUBLIC) for scrapers that can not log in.
+    """
+    if config.metrics_public:
+        return None
+    return await get_current_user(await oauth2_scheme(request))
+
+
+async def get_stream_user(request: Request, token: Optional[str] = Query(None, description="Access token for clients that can not set headers")) -> Dict[str, Any]:
+    """
+    Authenticate a stream connection once. The token is read from the
+    Authorization header or, for EventSource clients, from the token query parameter.
+    """
+    authorization = request.headers.get("Authorization", "")
+    if authorization.lower().startswith("bearer "):
+        token = authorization[7:]
+
+    if not token:
+        logger.warning("Stream connection without token")
+        raise HTTPException(status_code=401, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+
+    return verify_access_token(token)
@@ -0,0 +1,107 @@
+#!/usr/bin/python3
+"""
+Check of the APT engine against the fixture tree in benchmarks/fixtures/apt.
+
+The fixture holds a dpkg status file and package indexes of a main suite
+(plain), a security suite (gzip, InRelease), backports (NotAutomatic with
+ButAutomaticUpgrades), experimental (NotAutomatic) and an updates mirror
+with "security" in its host name. The check asserts the total, security
+and held counts, the candidate picked for packages installed from
+backports, and that the memoized counts are only computed again when the
+status file changes. Prints the results as JSON.
+
+Usage (from the monitoring_api directory):
+    python benchmarks/apt_check.py
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+
+sys.argv = sys.argv[:1]
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("LOG_LEVEL", "ERROR")
+os.environ.setdefault("LOG_DIR", "/tmp/server-monitor-benchmark")
+
+from services.apt import AptCounts, AptEngine  # noqa: E402
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "apt")
+
+# libc6 (amd64 and i386) and curl from security, vim held, bpo-tool from backports and tzdata from
+# the updates mirror. bpo and exp stay on their main and experimental versions.
+EXPECTED = AptCounts(total=6, security=3, held=1)
+
+
+class CountingEngine(AptEngine):
+    """AptEngine counting how often the counts are computed."""
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.computed = 0
+
+    def _compute(self, files):
+        self.computed += 1
+        return super()._compute(files)
+
+
+def replace_in_status(path: str, old: str, new: str) -> None:
+    """Rewrite one line of the dpkg status file."""
+    with open(path) as f:
+        text = f.read()
+    if old not in text:
+        raise AssertionError(f"{old!r} is not in the status file")
+    with open(path, "w") as f:
+        f.write(text.replace(old, new))
+
+
+def main() -> None:
+    workdir = tempfile.mkdtemp(prefix="server-monitor-apt-")
+    results = {}
+    failures = []
+
+    def check(name: str, actual, expected) -> None:
+        results[name] = {"actual": str(actual), "expected": str(expected)}
+        if actual != expected:
+            failures.append(name)
+
+    try:
+        # Work on a copy, the status file is changed below
+        shutil.copytree(FIXTURE, workdir, dirs_exist_ok=True)
+        status = os.path.join(workdir, "status")
+        engine = CountingEngine(status, os.path.join(workdir, "lists"))
+
+        start = time.perf_counter()
+        check("counts", engine.count(), EXPECTED)
+        results["compute_ms"] = round((time.perf_counter() - start) * 1000, 3)
+
+        engine.count()
+        check("memoized", engine.computed, 1)
+
+        # Same content with a new mtime is computed again
+        stat = os.stat(status)
+        os.utime(status, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+        engine.count()
+        check("recomputed after mtime change", engine.computed, 2)
+
+        # bpo installed from backports: its newer backports version is the candidate now
+        replace_in_status(status, "Version: 1.0-1\nDescription: bpo\n", "Version: 1.2~bpo12+1\nDescription: bpo\n")
+        check("backports candidate", engine.count(), AptCounts(total=7, security=3, held=1))
+
+        # vim no longer held
+        replace_in_status(status, "Status: hold ok installed", "Status: install ok installed")
+        check("hold released", engine.count(), AptCounts(total=7, security=3, held=0))
+        check("computed", engine.computed, 4)
+
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(json.dumps({"results": results, "failures": failures}, indent=2))
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
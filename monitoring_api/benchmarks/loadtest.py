@@ -0,0 +1,227 @@
+#!/usr/bin/python3
+"""
+Load test of the status routes over real HTTP.
+
+Starts local stand-ins for ipify and Tautulli, starts the API on a free port
+pointed at them (with its own temporary user database, history, logs and
+shared memory files), logs in once and then drives every status route in
+turn with a number of concurrent clients. Prints requests per second and
+p50/p99 latency per route as JSON, together with how often the stand-ins
+were called.
+
+Usage (from the monitoring_api directory):
+    python benchmarks/loadtest.py [--clients 32] [--seconds 10] [--workers 1] [--output results.json]
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import shutil
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from typing import Dict, List, Optional
+from aiohttp import ClientError, ClientSession, TCPConnector, web
+
+ROUTES = ["ip", "disk", "apt", "load", "memory", "users", "processes", "plex", "all"]
+USERNAME = "loadtest"
+PASSWORD = "loadtest"
+TAUTULLI_API = "loadtest-api-key"
+
+parser = argparse.ArgumentParser(description="Status route load test")
+parser.add_argument("--clients", type=int, default=32, help="Concurrent clients per route (default: 32)")
+parser.add_argument("--seconds", type=float, default=10, help="Duration of the run per route (default: 10)")
+parser.add_argument("--workers", type=int, default=1, help="API worker processes (default: 1)")
+parser.add_argument("--routes", type=str, default=",".join(ROUTES), help=f"Comma-separated status routes to drive (default: {','.join(ROUTES)})")
+parser.add_argument("--sessions", type=int, default=5, help="Plex sessions reported by the fake Tautulli (default: 5)")
+parser.add_argument("--fast-json", action="store_true", help="Run the API with FAST_JSON enabled")
+parser.add_argument("--output", type=str, help="Also write the results to this file")
+args = parser.parse_args()
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port() -> int:
+    """Return a TCP port that is free on the loopback interface."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(latencies: List[float], q: float) -> float:
+    """Return the q quantile of sorted latencies in milliseconds."""
+    if not latencies:
+        return 0.0
+    return round(latencies[min(int(q * len(latencies)), len(latencies) - 1)] * 1000, 3)
+
+
+class FakeUpstreams:
+    """ipify and Tautulli stand-ins answering with canned payloads and counting their calls."""
+
+    def __init__(self, sessions: int) -> None:
+        self.calls = {"ipify": 0, "tautulli": 0}
+        session = {"username": "user", "full_title": "Some Movie", "state": "playing", "bandwidth": "8000"}
+        self.activity = {"response": {"result": "success", "message": None, "data": {
+            "stream_count": str(sessions), "total_bandwidth": 8000 * sessions,
+            "sessions": [dict(session, session_key=str(i)) for i in range(sessions)]}}}
+        self.runner: Optional[web.AppRunner] = None
+        self.port = free_port()
+
+    async def ipify(self, request: web.Request) -> web.Response:
+        self.calls["ipify"] += 1
+        return web.json_response({"ip": "203.0.113.10"})
+
+    async def tautulli(self, request: web.Request) -> web.Response:
+        self.calls["tautulli"] += 1
+        if request.query.get("apikey") != TAUTULLI_API:
+            return web.json_response({"response": {"result": "error", "message": "Invalid apikey"}}, status=401)
+        return web.json_response(self.activity)
+
+    async def start(self) -> None:
+        app = web.Application()
+        app.router.add_get("/ipify", self.ipify)
+        app.router.add_get("/api/v2", self.tautulli)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, "127.0.0.1", self.port).start()
+
+    async def stop(self) -> None:
+        await self.runner.cleanup()
+
+
+def start_api(workdir: str, port: int, upstream_port: int) -> subprocess.Popen:
+    """Add the load test user and start the API in the background."""
+    env = dict(
+        os.environ,
+        HOST_IP="127.0.0.1",
+        HOST_PORT=str(port),
+        WORKERS=str(args.workers),
+        LOG_LEVEL="WARNING",
+        LOG_DIR=os.path.join(workdir, "logs"),
+        DB_NAME=os.path.join(workdir, "users.db"),
+        HISTORY_DB=os.path.join(workdir, "history.db"),
+        RATE_LIMIT_FILE=os.path.join(workdir, "ratelimit"),
+        SNAPSHOT_FILE=os.path.join(workdir, "snapshot"),
+        # The load test is one client, it must not be rate limited
+        API_RATE_LIMIT="1000000",
+        IP_CHECK_URL=f"http://127.0.0.1:{upstream_port}/ipify",
+        TAUTULLI_URL=f"http://127.0.0.1:{upstream_port}",
+        TAUTULLI_API=TAUTULLI_API,
+        FAST_JSON=str(args.fast_json).lower(),
+    )
+    main = os.path.join(APP_DIR, "main.py")
+    subprocess.run([sys.executable, main, "--add-users", "--db-username", USERNAME, "--db-password", PASSWORD],
+                   cwd=APP_DIR, env=env, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    with open(os.path.join(workdir, "api.log"), "wb") as log:
+        return subprocess.Popen([sys.executable, main], cwd=APP_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+async def wait_ready(client: ClientSession, base: str, api: subprocess.Popen, timeout: float = 60) -> None:
+    """Wait until the API answers, an unauthenticated request is enough."""
+    end = time.monotonic() + timeout
+    while time.monotonic() < end:
+        if api.poll() is not None:
+            raise RuntimeError(f"API exited with code {api.returncode}")
+        try:
+            async with client.get(f"{base}/status/load") as response:
+                await response.read()
+                return
+        except OSError:
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"API did not answer within {timeout} seconds")
+
+
+async def drive(client: ClientSession, url: str, headers: Dict[str, str]) -> Dict[str, float]:
+    """Run args.clients clients against one route for args.seconds and summarize the latencies."""
+    latencies: List[float] = []
+    errors = 0
+    end = time.perf_counter() + args.seconds
+
+    async def run_client() -> None:
+        nonlocal errors
+        while time.perf_counter() < end:
+            start = time.perf_counter()
+            try:
+                async with client.get(url, headers=headers) as response:
+                    await response.read()
+                    ok = response.status == 200
+            except ClientError:
+                ok = False
+            latencies.append(time.perf_counter() - start)
+            if not ok:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*[run_client() for _ in range(args.clients)])
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": percentile(latencies, 0.5),
+        "p99_ms": percentile(latencies, 0.99),
+        "max_ms": percentile(latencies, 1.0),
+    }
+
+
+async def main() -> None:
+    routes = [route.strip() for route in args.routes.split(",") if route.strip()]
+    workdir = tempfile.mkdtemp(prefix="server-monitor-loadtest-")
+    upstreams = FakeUpstreams(args.sessions)
+    await upstreams.start()
+    port = free_port()
+    api = start_api(workdir, port, upstreams.port)
+    base = f"http://127.0.0.1:{port}/api"
+
+    try:
+        async with ClientSession(connector=TCPConnector(limit=args.clients)) as client:
+            await wait_ready(client, base, api)
+            async with client.post(f"{base}/auth/token", data={"username": USERNAME, "password": PASSWORD}) as response:
+                response.raise_for_status()
+                headers = {"Authorization": f"Bearer {(await response.json())['access_token']}"}
+
+            # One request per route first, so the first samples are not part of the numbers
+            for route in routes:
+                async with client.get(f"{base}/status/{route}", headers=headers) as response:
+                    await response.read()
+
+            results = {}
+            for route in routes:
+                results[route] = await drive(client, f"{base}/status/{route}", headers)
+
+        report = {
+            "clients": args.clients,
+            "seconds_per_route": args.seconds,
+            "workers": args.workers,
+            "fast_json": args.fast_json,
+            "routes": results,
+            "upstream_calls": upstreams.calls,
+        }
+        text = json.dumps(report, indent=2)
+        print(text)
+        if args.output:
+            with open(args.output, "w") as output:
+                output.write(text + "\n")
+
+    except Exception:
+        print(f"Load test failed, API log: {os.path.join(workdir, 'api.log')}", file=sys.stderr)
+        workdir = None
+        raise
+
+    finally:
+        api.terminate()
+        try:
+            api.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            api.kill()
+        await upstreams.stop()
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
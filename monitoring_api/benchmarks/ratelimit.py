@@ -0,0 +1,103 @@
+#!/usr/bin/python3
+"""
+Benchmark of the shared memory rate limiter.
+
+Reports the cost of one limiter call for a hot key and for many distinct
+keys, then lets several processes hammer the same key to check that they
+share one budget: the allowed total should stay close to burst + rate * time
+no matter how many processes there are.
+
+Usage (from the monitoring_api directory):
+    python benchmarks/ratelimit.py [--calls 200000] [--processes 4] [--seconds 2]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import multiprocessing
+
+# Parse our own arguments before the app's Config parses sys.argv
+parser = argparse.ArgumentParser(description="Shared memory rate limiter benchmark")
+parser.add_argument("--calls", type=int, default=200000, help="Limiter calls per measurement (default: 200000)")
+parser.add_argument("--processes", type=int, default=4, help="Processes sharing one key (default: 4)")
+parser.add_argument("--seconds", type=float, default=2, help="Duration of the shared key run (default: 2)")
+parser.add_argument("--rate", type=float, default=100, help="Allowed requests per second for the shared key (default: 100)")
+args = parser.parse_args()
+sys.argv = sys.argv[:1]
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("LOG_LEVEL", "ERROR")
+os.environ.setdefault("LOG_DIR", "/tmp/server-monitor-benchmark")
+
+# Keep the benchmark away from the table of a running API
+PATH = os.path.join(tempfile.gettempdir(), f"server-monitor-ratelimit-benchmark-{os.getpid()}")
+SLOTS = 4096
+os.environ["RATE_LIMIT_FILE"] = PATH
+os.environ["RATE_LIMIT_SLOTS"] = str(SLOTS)
+
+from services.ratelimit import SharedTable, TokenBucket, LoginThrottle  # noqa: E402
+
+
+def per_call(label: str, func, keys: list) -> dict:
+    """Time args.calls calls of func cycling over keys."""
+    count = len(keys)
+    start = time.perf_counter()
+    for i in range(args.calls):
+        func(keys[i % count])
+    elapsed = time.perf_counter() - start
+    return {"case": label, "us_per_call": round(elapsed / args.calls * 1e6, 3)}
+
+
+def hammer(result: "multiprocessing.Queue") -> None:
+    """Hit one shared key as fast as possible for args.seconds and report how many hits were allowed."""
+    bucket = TokenBucket(SharedTable(PATH, SLOTS), args.rate, args.rate)
+    allowed = calls = 0
+    end = time.time() + args.seconds
+    while time.time() < end:
+        calls += 1
+        if not bucket.hit("ip:shared"):
+            allowed += 1
+    result.put((allowed, calls))
+
+
+def main() -> None:
+    table = SharedTable(PATH, SLOTS)
+    bucket = TokenBucket(table, 1e9, 1e9)
+    throttle = LoginThrottle(table, 5, 600, 600)
+
+    results = [
+        per_call("token bucket, one key", bucket.hit, ["ip:127.0.0.1"]),
+        per_call("token bucket, 10000 keys", bucket.hit, [f"ip:10.0.{i // 256}.{i % 256}" for i in range(10000)]),
+        per_call("login block check, one key", throttle.blocked, ["login-user:admin"]),
+    ]
+
+    # All processes share one budget, so more processes must not mean more allowed hits
+    start_tokens = args.rate
+    queue: "multiprocessing.Queue" = multiprocessing.Queue()
+    table.delete("ip:shared")
+    workers = [multiprocessing.Process(target=hammer, args=(queue,)) for _ in range(args.processes)]
+    for worker in workers:
+        worker.start()
+    totals = [queue.get() for _ in workers]
+    for worker in workers:
+        worker.join()
+    allowed = sum(total[0] for total in totals)
+    calls = sum(total[1] for total in totals)
+
+    shared = {
+        "processes": args.processes,
+        "calls": calls,
+        "allowed": allowed,
+        "expected_at_most": int(start_tokens + args.rate * args.seconds),
+        "us_per_call_contended": round(args.seconds * args.processes / calls * 1e6, 3),
+    }
+    print(json.dumps({"table_bytes": table.size, "per_call": results, "shared_key": shared}, indent=2))
+    table.close()
+    os.remove(PATH)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/python3
+"""
+Micro-benchmark of the status route serialization, comparing the default
+FastAPI response path with the fast JSON path (FAST_JSON).
+
+Drives the ASGI app in process, so the numbers cover routing, auth and
+serialization but no network. Plex is served from a canned Tautulli payload.
+
+Usage (from the monitoring_api directory):
+    python benchmarks/serialization.py [--requests 2000] [--sessions 20]
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tracemalloc
+
+# Parse our own arguments before the app's Config parses sys.argv
+parser = argparse.ArgumentParser(description="Status route serialization benchmark")
+parser.add_argument("--requests", type=int, default=2000, help="Requests per route and mode (default: 2000)")
+parser.add_argument("--sessions", type=int, default=20, help="Plex sessions in the canned payload (default: 20)")
+args = parser.parse_args()
+sys.argv = sys.argv[:1]
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("LOG_LEVEL", "ERROR")
+os.environ.setdefault("LOG_DIR", "/tmp/server-monitor-benchmark")
+os.environ.setdefault("DB_NAME", "/tmp/server-monitor-benchmark/users.db")
+os.environ.setdefault("HISTORY_DB", "/tmp/server-monitor-benchmark/history.db")
+
+from config import config  # noqa: E402
+from main import app  # noqa: E402
+from auth import create_access_token  # noqa: E402
+from services.models import PlexStatus  # noqa: E402
+from services.monitoring import check_plex, parse_activity  # noqa: E402
+from services.collector import collector  # noqa: E402
+from services.ratelimit import limiter  # noqa: E402
+
+
+def plex_payload(sessions: int) -> dict:
+    """Build a Tautulli get_activity response with the given number of sessions."""
+    session = {f"field_{i}": f"value {i}" for i in range(150)}
+    session.update({"username": "user", "full_title": "Some Movie", "state": "playing", "bandwidth": "8000"})
+    return {"response": {"result": "success", "data": {
+        "stream_count": str(sessions), "total_bandwidth": 8000 * sessions,
+        "sessions": [dict(session, session_key=str(i)) for i in range(sessions)]}}}
+
+
+async def call(path: str, token: str) -> int:
+    """Run one GET request through the ASGI app and return the status code."""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"", "root_path": "",
+        "headers": [(b"authorization", f"Bearer {token}".encode()), (b"host", b"benchmark")],
+        "client": ("127.0.0.1", 1234), "server": ("benchmark", 80),
+    }
+    status = 0
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await app(scope, receive, send)
+    return status
+
+
+async def measure(path: str, token: str, requests: int) -> dict:
+    """Measure requests per second and peak allocated bytes per request for one route."""
+    status = await call(path, token)
+    if status != 200:
+        raise RuntimeError(f"{path} answered {status}")
+    for _ in range(50):
+        await call(path, token)
+
+    start = time.perf_counter()
+    for _ in range(requests):
+        await call(path, token)
+    elapsed = time.perf_counter() - start
+
+    # Allocations are measured in a separate pass, tracing slows everything down
+    tracemalloc.start()
+    peaks = []
+    for _ in range(min(requests, 200)):
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        await call(path, token)
+        peaks.append(tracemalloc.get_traced_memory()[1] - base)
+    tracemalloc.stop()
+
+    return {"rps": round(requests / elapsed, 1), "alloc_peak_bytes_per_request": int(sum(peaks) / len(peaks))}
+
+
+async def main() -> None:
+    payload = plex_payload(args.sessions)
+
+    async def canned_plex() -> PlexStatus:
+        return parse_activity(payload)
+
+    check_plex.cache.func = canned_plex
+    # Serve every check from the snapshot and lift the rate limit for the run
+    limiter.enabled = False
+    await collector.read_many(list(collector.intervals))
+    token = create_access_token({"sub": "benchmark"})
+
+    results = {}
+    for route in ["/api/status/all", "/api/status/plex"]:
+        for fast in (False, True):
+            config.fast_json = fast
+            results[f"{route} ({'fast' if fast else 'default'})"] = await measure(route, token, args.requests)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,125 @@
+#!/usr/bin/python3
+"""
+Fake Tautulli webhook sender.
+
+Plays a scripted set of Plex sessions against a running API started with
+TAUTULLI_WEBHOOK_SECRET: every session starts playing, gets paused,
+resumed and a transcode change, and half of them stop again. Afterwards
+/api/status/plex must report exactly the sessions that are still playing.
+Prints the webhook latency and whether the session table matched as JSON.
+
+Usage (from the monitoring_api directory):
+    python benchmarks/webhook.py --secret SECRET --username USER --password PASSWORD [--url http://127.0.0.1:8000] [--sessions 50]
+"""
+
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+from typing import Any, Dict, List
+from aiohttp import ClientSession
+
+parser = argparse.ArgumentParser(description="Fake Tautulli webhook sender")
+parser.add_argument("--url", type=str, default="http://127.0.0.1:8000", help="Base URL of the API (default: http://127.0.0.1:8000)")
+parser.add_argument("--secret", type=str, required=True, help="TAUTULLI_WEBHOOK_SECRET of the API")
+parser.add_argument("--username", type=str, required=True, help="API user to read the Plex status with")
+parser.add_argument("--password", type=str, required=True, help="Password of the API user")
+parser.add_argument("--sessions", type=int, default=50, help="Number of sessions to play (default: 50)")
+parser.add_argument("--seed", type=int, default=1, help="Seed for the order of the events (default: 1)")
+args = parser.parse_args()
+
+
+def session_fields(index: int) -> Dict[str, Any]:
+    """Fields the recommended webhook template sends for a session."""
+    episode = index % 2 == 0
+    return {
+        "session_key": str(1000 + index),
+        "username": f"user{index % 7}",
+        "friendly_name": f"User {index % 7}",
+        "full_title": f"Show {index} - Episode" if episode else f"Movie {index}",
+        "library_name": "TV Shows" if episode else "Movies",
+        "media_type": "episode" if episode else "movie",
+        "parent_media_index": "1" if episode else "",
+        "media_index": str(index % 12 + 1) if episode else "",
+        "progress_percent": "0",
+        "platform": "Chrome",
+        "device": "Windows",
+        "ip_address_public": f"198.51.100.{index % 250}",
+        "bandwidth": str(4000 + index),
+        "quality_profile": "Original",
+        "video_full_resolution": "1080p",
+    }
+
+
+def script() -> List[Dict[str, Any]]:
+    """Build the events: play, pause, resume and transcode per session, stop for every second one."""
+    rng = random.Random(args.seed)
+    per_session = []
+    for index in range(args.sessions):
+        key = str(1000 + index)
+        events = [dict(session_fields(index), action="play")]
+        events += [{"action": "pause", "session_key": key, "progress_percent": "20"},
+                   {"action": "resume", "session_key": key},
+                   {"action": "transcode", "session_key": key, "quality_profile": "4 Mbps 720p", "video_full_resolution": "720p"}]
+        if index % 2:
+            events.append({"action": "stop", "session_key": key})
+        per_session.append(events)
+
+    # Interleave the sessions while keeping the order of the events of each session
+    ordered = []
+    while per_session:
+        events = rng.choice(per_session)
+        ordered.append(events.pop(0))
+        if not events:
+            per_session.remove(events)
+    return ordered
+
+
+async def main() -> None:
+    events = script()
+    latencies = []
+    errors = 0
+
+    async with ClientSession() as client:
+        headers = {"X-Webhook-Secret": args.secret}
+        start = time.perf_counter()
+        for event in events:
+            sent = time.perf_counter()
+            async with client.post(f"{args.url}/api/webhooks/tautulli", json=event, headers=headers) as response:
+                await response.read()
+                if response.status != 200:
+                    errors += 1
+            latencies.append(time.perf_counter() - sent)
+        elapsed = time.perf_counter() - start
+
+        async with client.post(f"{args.url}/api/auth/token", data={"username": args.username, "password": args.password}) as response:
+            response.raise_for_status()
+            token = (await response.json())["access_token"]
+        async with client.get(f"{args.url}/api/status/plex", headers={"Authorization": f"Bearer {token}"}) as response:
+            status = await response.json()
+
+    # Sessions with an even index are still playing at 720p
+    expected = {str(1000 + index) for index in range(0, args.sessions, 2)}
+    reported = {session["session_key"]: session for session in status.get("sessions", [])}
+    matched = reported.keys() == expected and all(
+        session["state"] == "playing" and session["video_full_resolution"] == "720p" for session in reported.values())
+
+    latencies.sort()
+    print(json.dumps({
+        "events": len(events),
+        "errors": errors,
+        "events_per_second": round(len(events) / elapsed, 1),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 3),
+        "p99_ms": round(latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)] * 1000, 3),
+        "stream_count": status.get("stream_count"),
+        "expected_stream_count": len(expected),
+        "matched": matched,
+    }, indent=2))
+    if not matched or errors:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -2,11 +2,22 @@
 
 import argparse
 import os
-from typing import Optional
+from typing import Dict, Optional
 from pathlib import Path
 from dotenv import load_dotenv
 
 
+def parse_key_values(value: str) -> Dict[str, float]:
+    """Parse a comma-separated list of key=number pairs into a dict."""
+    result = {}
+    for item in value.split(","):
+        if "=" not in item:
+            continue
+        key, number = item.split("=", 1)
+        result[key.strip()] = float(number)
+    return result
+
+
 class Config:
     """Singleton class to store configuration settings."""
     _instance: Optional["Config"] = None
@@ -30,12 +41,22 @@ class Config:
                             help="Log filename (default: app)")
         parser.add_argument("-L", "--log-level", type=str, choices=[
                             "DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"], help="Log level (default: INFO)")
+        parser.add_argument("--log-format", type=str, choices=["text", "json"],
+                            help="Format of the log files (default: text)")
+        parser.add_argument("--access-log-sample", type=str,
+                            help="Comma-separated level=fraction of access log lines kept, e.g. info=0.1 (default: all kept)")
+        parser.add_argument("--access-log-rate", type=str,
+                            help="Comma-separated level=lines per second the access log writes at most, e.g. info=20 (default: no limit)")
         parser.add_argument("-i", "--host-ip", type=str,
                             help="API server IP address (default: 0.0.0.0)")
         parser.add_argument("-p", "--host-port", type=int,
                             help="API server port (default: 8000)")
         parser.add_argument("-d", "--monitored-disks", type=str,
-                            help="Comma-separated list of monitored disks (default: /)")
+                            help="Comma-separated list of monitored mount points, globs like /mnt/* track every matching mount (default: /)")
+        parser.add_argument("--disk-fstypes", type=str,
+                            help="Comma-separated filesystem types a monitored mount must have (default: any)")
+        parser.add_argument("--disk-exclude-fstypes", type=str,
+                            help="Comma-separated filesystem types that are never monitored (default: kernel and virtual filesystems)")
         parser.add_argument("-P", "--monitored-processes", type=str,
                             help="Comma-separated list of monitored processes (default: ssh)")
         parser.add_argument("-s", "--oauth-secret-key", type=str,
@@ -50,6 +71,10 @@ class Config:
                             help="Max failed attempts before blocking token request (default: 5)")
         parser.add_argument("-b", "--block-time-minutes", type=int,
                             help="Block duration in minutes (default: 10)")
+        parser.add_argument("--rate-limit-file", type=str,
+                            help="Shared memory file with the rate limit state of all workers (default: /dev/shm/server-monitor-ratelimit-HOST_PORT)")
+        parser.add_argument("--rate-limit-slots", type=int,
+                            help="Number of clients and users the rate limit table can track (default: 4096)")
         parser.add_argument("-D", "--db-name", type=str,
                             help="Name of the database (default: users.db)")
         parser.add_argument("--add-users", action="store_true",
@@ -58,10 +83,80 @@ class Config:
                             help="Username for the new user")
         parser.add_argument("--db-password", type=str,
                             help="Password for the new user")
+        parser.add_argument("--user-cache-check-interval", type=float,
+                            help="Seconds between checks of the user database for outside changes (default: 5)")
+        parser.add_argument("-w", "--workers", type=int,
+                            help="Number of API worker processes, more than 1 runs the collector in its own process (default: 1)")
+        parser.add_argument("--snapshot-file", type=str,
+                            help="Shared memory file the collector process publishes its snapshot to (default: /dev/shm/server-monitor-snapshot-HOST_PORT)")
+        parser.add_argument("--snapshot-size", type=int,
+                            help="Size in bytes of each of the two snapshot buffers (default: 1048576)")
+        parser.add_argument("--snapshot-poll-interval", type=float,
+                            help="Seconds between checks of the shared snapshot for new samples (default: 0.1)")
+        parser.add_argument("--ip-check-url", type=str,
+                            help="URL returning the public IP as {\"ip\": ...} JSON (default: https://api4.ipify.org?format=json)")
         parser.add_argument("--tautulli-url", type=str,
                             help="URL of the Tautulli instance (default: http://0.0.0.0:8181)")
         parser.add_argument("--tautulli-api", type=str,
                             help="Tautulli API key (default: change-this-api-key)")
+        parser.add_argument("--tautulli-webhook-secret", type=str,
+                            help="Secret Tautulli sends with its webhooks, enables the live Plex session table (default: none)")
+        parser.add_argument("--tautulli-reconcile-interval", type=float,
+                            help="Seconds between repairs of the Plex session table from Tautulli's activity (default: 300)")
+        parser.add_argument("--collect-intervals", type=str,
+                            help="Comma-separated check=seconds sample intervals for the background collector (default: ip=300,disk=60,apt=3600,load=5,memory=5,users=30,processes=15)")
+        parser.add_argument("--check-timeouts", type=str,
+                            help="Comma-separated check=seconds deadlines before a check is reported as timed out (default: ip=5,disk=5,apt=30,load=2,memory=2,users=2,processes=5)")
+        parser.add_argument("--probe-workers", type=int,
+                            help="Number of worker threads for blocking system probes (default: 4)")
+        parser.add_argument("--check-ttls", type=str,
+                            help="Comma-separated check=seconds time a check result is reused before it is refreshed (default: ip=60,disk=10,apt=3600,load=1,memory=1,users=5,processes=5,plex=5)")
+        parser.add_argument("--http-pool-size", type=int,
+                            help="Maximum number of pooled outbound HTTP connections (default: 20)")
+        parser.add_argument("--http-pool-per-host", type=int,
+                            help="Maximum number of pooled outbound HTTP connections per host (default: 5)")
+        parser.add_argument("--http-dns-cache-ttl", type=int,
+                            help="Seconds outbound DNS lookups are cached (default: 300)")
+        parser.add_argument("--http-connect-timeout", type=float,
+                            help="Outbound HTTP connect timeout in seconds (default: 5)")
+        parser.add_argument("--http-read-timeout", type=float,
+                            help="Outbound HTTP read timeout in seconds (default: 10)")
+        parser.add_argument("--history-db", type=str,
+                            help="SQLite file for the metric history (default: history.db)")
+        parser.add_argument("--history-retention", type=str,
+                            help="Comma-separated resolution=seconds retention of the metric history (default: raw=86400,1m=604800,1h=7776000,1d=63072000)")
+        parser.add_argument("--history-flush-interval", type=float,
+                            help="Seconds between batched writes to the metric history (default: 10)")
+        parser.add_argument("--stream-queue-size", type=int,
+                            help="Events queued per stream client before the oldest are dropped (default: 100)")
+        parser.add_argument("--stream-backlog", type=int,
+                            help="Number of recent stream events kept for resuming clients (default: 1000)")
+        parser.add_argument("--stream-keepalive", type=float,
+                            help="Seconds between keepalive comments on an idle stream (default: 15)")
+        parser.add_argument("--token-cache-size", type=int,
+                            help="Maximum number of verified tokens kept in memory (default: 1024)")
+        parser.add_argument("--bcrypt-workers", type=int,
+                            help="Threads used for password hashing and verification (default: 2)")
+        parser.add_argument("--bcrypt-queue-size", type=int,
+                            help="Logins allowed to wait for a bcrypt thread before new ones get a 503 (default: 8)")
+        parser.add_argument("--fleet-nodes", type=str,
+                            help="Comma-separated name=url monitoring APIs to aggregate, or @file with one per line (default: none, fleet mode off)")
+        parser.add_argument("--fleet-username", type=str,
+                            help="Username the aggregator logs in with on every node")
+        parser.add_argument("--fleet-password", type=str,
+                            help="Password the aggregator logs in with on every node")
+        parser.add_argument("--fleet-poll-interval", type=float,
+                            help="Seconds between polls of the fleet nodes (default: 15)")
+        parser.add_argument("--fleet-concurrency", type=int,
+                            help="Maximum number of fleet nodes polled at the same time (default: 20)")
+        parser.add_argument("--fleet-timeout", type=float,
+                            help="Seconds a poll of one fleet node may take (default: 5)")
+        parser.add_argument("--fleet-stale-after", type=float,
+                            help="Seconds without a successful poll before a fleet node is reported as stale (default: 60)")
+        parser.add_argument("--metrics-public", action="store_true",
+                            help="Serve /metrics without authentication")
+        parser.add_argument("--fast-json", action="store_true",
+                            help="Serve status routes through the fast JSON path")
         args = parser.parse_args()
 
         # Load .env file
@@ -80,10 +175,17 @@ class Config:
         self.log_filename = get_env_var(
             args.log_filename, "LOG_FILENAME", "app")
         self.log_level = get_env_var(args.log_level, "LOG_LEVEL", "INFO")
+        self.log_format = get_env_var(args.log_format, "LOG_FORMAT", "text")
+        self.access_log_sample = parse_key_values(get_env_var(args.access_log_sample, "ACCESS_LOG_SAMPLE", ""))
+        self.access_log_rate = parse_key_values(get_env_var(args.access_log_rate, "ACCESS_LOG_RATE", ""))
         self.host_ip = get_env_var(args.host_ip, "HOST_IP", "0.0.0.0")
         self.host_port = get_env_var(args.host_port, "HOST_PORT", 8000)
         self.monitored_disks = get_env_var(
             args.monitored_disks, "MONITORED_DISKS", "/").split(",")
+        self.disk_fstypes = get_env_var(args.disk_fstypes, "DISK_FSTYPES", "")
+        self.disk_exclude_fstypes = get_env_var(args.disk_exclude_fstypes, "DISK_EXCLUDE_FSTYPES", (
+            "autofs,binfmt_misc,bpf,cgroup,cgroup2,configfs,debugfs,devpts,devtmpfs,efivarfs,fusectl,"
+            "hugetlbfs,mqueue,nsfs,proc,pstore,rpc_pipefs,securityfs,selinuxfs,squashfs,sysfs,tracefs"))
         self.monitored_processes = get_env_var(
             args.monitored_processes, "MONITORED_PROCESSES", "ssh").split(",")
         self.oauth_secret_key = get_env_var(
@@ -98,12 +200,53 @@ class Config:
             args.failed_attempt_limit, "FAILED_ATTEMPT_LIMIT", 5)
         self.block_time_minutes = get_env_var(
             args.block_time_minutes, "BLOCK_TIME_MINUTES", 10)
+        self.rate_limit_file = get_env_var(args.rate_limit_file, "RATE_LIMIT_FILE", None)
+        self.rate_limit_slots = get_env_var(args.rate_limit_slots, "RATE_LIMIT_SLOTS", 4096)
         self.db_name = get_env_var(args.db_name, "DB_NAME", "users.db")
         self.add_users = args.add_users
         self.db_username = args.db_username
         self.db_password = args.db_password
+        self.user_cache_check_interval = get_env_var(args.user_cache_check_interval, "USER_CACHE_CHECK_INTERVAL", 5)
+        self.workers = get_env_var(args.workers, "WORKERS", 1)
+        self.snapshot_file = get_env_var(args.snapshot_file, "SNAPSHOT_FILE", None)
+        self.snapshot_size = get_env_var(args.snapshot_size, "SNAPSHOT_SIZE", 1048576)
+        self.snapshot_poll_interval = get_env_var(args.snapshot_poll_interval, "SNAPSHOT_POLL_INTERVAL", 0.1)
+        self.ip_check_url = get_env_var(args.ip_check_url, "IP_CHECK_URL", "https://api4.ipify.org?format=json")
         self.tautulli_url = get_env_var(args.tautulli_url, "TAUTULLI_URL", "http://0.0.0.0:8181")
         self.tautulli_api = get_env_var(args.tautulli_api, "TAUTULLI_API", "change-this-api-key")
+        self.tautulli_webhook_secret = get_env_var(args.tautulli_webhook_secret, "TAUTULLI_WEBHOOK_SECRET", None)
+        self.tautulli_reconcile_interval = get_env_var(args.tautulli_reconcile_interval, "TAUTULLI_RECONCILE_INTERVAL", 300)
+        self.collect_intervals = parse_key_values(get_env_var(
+            args.collect_intervals, "COLLECT_INTERVALS", "ip=300,disk=60,apt=3600,load=5,memory=5,users=30,processes=15"))
+        self.check_timeouts = parse_key_values(get_env_var(
+            args.check_timeouts, "CHECK_TIMEOUTS", "ip=5,disk=5,apt=30,load=2,memory=2,users=2,processes=5"))
+        self.check_ttls = parse_key_values(get_env_var(
+            args.check_ttls, "CHECK_TTLS", "ip=60,disk=10,apt=3600,load=1,memory=1,users=5,processes=5,plex=5"))
+        self.probe_workers = get_env_var(args.probe_workers, "PROBE_WORKERS", 4)
+        self.http_pool_size = get_env_var(args.http_pool_size, "HTTP_POOL_SIZE", 20)
+        self.http_pool_per_host = get_env_var(args.http_pool_per_host, "HTTP_POOL_PER_HOST", 5)
+        self.http_dns_cache_ttl = get_env_var(args.http_dns_cache_ttl, "HTTP_DNS_CACHE_TTL", 300)
+        self.http_connect_timeout = get_env_var(args.http_connect_timeout, "HTTP_CONNECT_TIMEOUT", 5)
+        self.http_read_timeout = get_env_var(args.http_read_timeout, "HTTP_READ_TIMEOUT", 10)
+        self.history_db = get_env_var(args.history_db, "HISTORY_DB", "history.db")
+        self.history_retention = parse_key_values(get_env_var(
+            args.history_retention, "HISTORY_RETENTION", "raw=86400,1m=604800,1h=7776000,1d=63072000"))
+        self.history_flush_interval = get_env_var(args.history_flush_interval, "HISTORY_FLUSH_INTERVAL", 10)
+        self.stream_queue_size = get_env_var(args.stream_queue_size, "STREAM_QUEUE_SIZE", 100)
+        self.stream_backlog = get_env_var(args.stream_backlog, "STREAM_BACKLOG", 1000)
+        self.stream_keepalive = get_env_var(args.stream_keepalive, "STREAM_KEEPALIVE", 15)
+        self.token_cache_size = get_env_var(args.token_cache_size, "TOKEN_CACHE_SIZE", 1024)
+        self.bcrypt_workers = get_env_var(args.bcrypt_workers, "BCRYPT_WORKERS", 2)
+        self.bcrypt_queue_size = get_env_var(args.bcrypt_queue_size, "BCRYPT_QUEUE_SIZE", 8)
+        self.fleet_nodes = get_env_var(args.fleet_nodes, "FLEET_NODES", "")
+        self.fleet_username = get_env_var(args.fleet_username, "FLEET_USERNAME", None)
+        self.fleet_password = get_env_var(args.fleet_password, "FLEET_PASSWORD", None)
+        self.fleet_poll_interval = get_env_var(args.fleet_poll_interval, "FLEET_POLL_INTERVAL", 15)
+        self.fleet_concurrency = get_env_var(args.fleet_concurrency, "FLEET_CONCURRENCY", 20)
+        self.fleet_timeout = get_env_var(args.fleet_timeout, "FLEET_TIMEOUT", 5)
+        self.fleet_stale_after = get_env_var(args.fleet_stale_after, "FLEET_STALE_AFTER", 60)
+        self.metrics_public = args.metrics_public or os.getenv("METRICS_PUBLIC", "false").lower() == "true"
+        self.fast_json = args.fast_json or os.getenv("FAST_JSON", "false").lower() == "true"
 
 
 # Global instance of Config
@@ -1,38 +1,128 @@
 #!/usr/bin/python3
 
+import os
+import time
+import signal
+import logging
+import asyncio
+import multiprocessing
 import uvicorn
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
-from slowapi import Limiter
-from slowapi.util import get_remote_address
-from slowapi.middleware import SlowAPIMiddleware
-from slowapi.errors import RateLimitExceeded
 from config import config
-from api.routes import router, rate_limit_exceeded_handler
-from services.logger import logger
-from services.db import add_user
+from api.routes import router, metrics_router, rate_limit_exceeded_handler
+from services.logger import access_logger, logger
+from services.db import add_user, user_store
+from services.collector import collector, shared_snapshot
+from services.executor import password_executor, probe_executor
+from services.fleet import fleet, fleet_snapshot
+from services.plex import plex_sessions
+from services.http_client import http_client
+from services.history import history
+from services.stream import broadcaster
+from services.ratelimit import RateLimitExceeded, rate_table
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Run the background collector, history store, fleet aggregator and shared HTTP client for as long
+    as the API is up. With several workers each worker follows the snapshots of the collector process instead.
+    """
+    workers = int(config.workers) > 1
+    await http_client.start()
+    await history.start(maintain=not workers)
+    if workers:
+        shared_snapshot.open()
+        collector.follow(shared_snapshot)
+        if fleet.enabled:
+            fleet_snapshot.open()
+            fleet.follow(fleet_snapshot)
+    else:
+        collector.subscribe(lambda name, sample: history.record(name, sample.value))
+    collector.subscribe(lambda name, sample: broadcaster.publish(name, sample.value))
+    await collector.start()
+    await fleet.start()
+    await plex_sessions.start()
+    yield
+    await plex_sessions.stop()
+    await fleet.stop()
+    await collector.stop()
+    await history.stop()
+    shared_snapshot.close()
+    fleet_snapshot.close()
+    probe_executor.shutdown()
+    password_executor.shutdown()
+    user_store.close()
+    rate_table.close()
+    await http_client.close()
 
-# Initialize Rate Limiter
-limiter = Limiter(key_func=get_remote_address)
 
 # Init API
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 app.include_router(router, prefix="/api")
+app.include_router(metrics_router)
 
-# Add Rate Limiting Middleware
+# Answer requests over the rate limit with a 429
 app.add_exception_handler(RateLimitExceeded, rate_limit_exceeded_handler)
-app.state.limiter = limiter
-app.add_middleware(SlowAPIMiddleware)
 
 
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
-    """Log every request and response."""
-    logger.info(f"Received request: {request.method} {request.url}")
+    """Log every request with its response status and duration as one access log line."""
+    start = time.perf_counter()
     response = await call_next(request)
-    logger.info(f"Response status: {response.status_code}")
+    status = response.status_code
+    level = logging.ERROR if status >= 500 else logging.WARNING if status >= 400 else logging.INFO
+    if access_logger.isEnabledFor(level):
+        duration_ms = round((time.perf_counter() - start) * 1000, 3)
+        access_logger.log(level, f"{request.method} {request.url.path} {status} {duration_ms} ms", extra={
+            "method": request.method, "path": request.url.path, "status": status, "duration_ms": duration_ms})
     return response
 
 
+async def run_collector() -> None:
+    """Run the collector, history store and fleet poller, publishing their results to the shared snapshots."""
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+
+    parent = os.getppid()
+    shared_snapshot.open()
+    await http_client.start()
+    await history.start()
+    collector.subscribe(lambda name, sample: history.record(name, sample.value))
+    collector.share(shared_snapshot)
+    await collector.start()
+    if fleet.enabled:
+        fleet_snapshot.open()
+        fleet.share(fleet_snapshot)
+        await fleet.start()
+
+    # Stop when asked to, or when the server process went away
+    while not stop.is_set() and os.getppid() == parent:
+        try:
+            await asyncio.wait_for(stop.wait(), 1)
+        except asyncio.TimeoutError:
+            pass
+
+    await fleet.stop()
+    await collector.stop()
+    await history.stop()
+    shared_snapshot.close()
+    fleet_snapshot.close()
+    probe_executor.shutdown()
+    await http_client.close()
+
+
+def collector_process() -> None:
+    """Entry point of the collector process."""
+    logger.info(f"Collector process started (pid {os.getpid()})")
+    asyncio.run(run_collector())
+    logger.info("Collector process stopped")
+
+
 def main():
     # Add users to database file
     if config.add_users:
@@ -47,7 +137,28 @@ def main():
 
     # Start API
     logger.info("Starting Server Monitor API server")
-    uvicorn.run(app, host=config.host_ip, port=int(config.host_port))
+    workers = int(config.workers)
+    # log_requests writes the sampled access lines without the query string, uvicorn's own access
+    # log would write every request (and every ?token= of the status stream) to the console.
+    # Without a log config of its own uvicorn's messages go through the logging queue as well.
+    if workers <= 1:
+        uvicorn.run(app, host=config.host_ip, port=int(config.host_port), access_log=False, log_config=None)
+        return
+
+    # One collector process feeds every worker through the shared snapshot
+    shared_snapshot.create()
+    if fleet.enabled:
+        fleet_snapshot.create()
+    process = multiprocessing.get_context("spawn").Process(target=collector_process, name="collector")
+    process.start()
+    try:
+        uvicorn.run("main:app", host=config.host_ip, port=int(config.host_port), workers=workers,
+                    access_log=False, log_config=None, app_dir=os.path.dirname(os.path.abspath(__file__)))
+    finally:
+        process.terminate()
+        process.join(10)
+        if process.is_alive():
+            process.kill()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,274 @@
+#!/usr/bin/python3
+
+import os
+import gzip
+import lzma
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set, Tuple
+from services.logger import logger
+
+# lz4 is optional, lz4 compressed indexes are skipped when it is not installed
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+DPKG_STATUS = "/var/lib/dpkg/status"
+APT_LISTS_DIR = "/var/lib/apt/lists"
+
+# Suffixes of the package indexes apt keeps, depending on Acquire::GzipIndexes and the compression order
+INDEX_SUFFIXES = ("_Packages", "_Packages.gz", "_Packages.xz", "_Packages.lz4")
+RELEASE_SUFFIXES = ("_InRelease", "_Release")
+
+# Default pin priorities: a normal release, a NotAutomatic release with ButAutomaticUpgrades
+# (e.g. backports), a NotAutomatic release (e.g. experimental) and the installed version
+PRIORITY_DEFAULT = 500
+PRIORITY_BUT_AUTOMATIC = 100
+PRIORITY_NOT_AUTOMATIC = 1
+PRIORITY_INSTALLED = 100
+
+
+@dataclass(frozen=True)
+class AptCounts:
+    """Number of upgradable packages, how many come from a security archive and how many are held."""
+    total: int
+    security: int
+    held: int
+
+
+def _order(char: str) -> int:
+    """Sort weight of a single character in the non-digit part of a Debian version."""
+    if char == "~":
+        return -1
+    if char.isdigit():
+        return 0
+    if char.isalpha():
+        return ord(char)
+    return ord(char) + 256
+
+
+def _compare_part(a: str, b: str) -> int:
+    """Compare an upstream version or revision using the dpkg algorithm."""
+    i = j = 0
+    while i < len(a) or j < len(b):
+        # Compare the non-digit prefixes character by character
+        while (i < len(a) and not a[i].isdigit()) or (j < len(b) and not b[j].isdigit()):
+            ac = _order(a[i]) if i < len(a) and not a[i].isdigit() else 0
+            bc = _order(b[j]) if j < len(b) and not b[j].isdigit() else 0
+            if ac != bc:
+                return ac - bc
+            i += 1
+            j += 1
+
+        # Compare the following digit runs numerically
+        start_i = i
+        while i < len(a) and a[i].isdigit():
+            i += 1
+        start_j = j
+        while j < len(b) and b[j].isdigit():
+            j += 1
+        diff = int(a[start_i:i] or 0) - int(b[start_j:j] or 0)
+        if diff:
+            return diff
+    return 0
+
+
+def _split_version(version: str) -> Tuple[int, str, str]:
+    """Split a Debian version into epoch, upstream version and revision."""
+    epoch = 0
+    if ":" in version:
+        epoch_str, version = version.split(":", 1)
+        epoch = int(epoch_str or 0)
+    upstream, _, revision = version.rpartition("-")
+    if not upstream:
+        upstream, revision = revision, ""
+    return epoch, upstream, revision
+
+
+def compare_versions(a: str, b: str) -> int:
+    """Compare two Debian package versions, returns <0, 0 or >0 like dpkg --compare-versions."""
+    epoch_a, upstream_a, revision_a = _split_version(a)
+    epoch_b, upstream_b, revision_b = _split_version(b)
+    if epoch_a != epoch_b:
+        return epoch_a - epoch_b
+    return _compare_part(upstream_a, upstream_b) or _compare_part(revision_a, revision_b)
+
+
+def _open(path: str):
+    """Open a plain or compressed list file for binary reading."""
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    if path.endswith(".xz"):
+        return lzma.open(path, "rb")
+    if path.endswith(".lz4"):
+        return lz4.frame.open(path, "rb")
+    return open(path, "rb")
+
+
+def _read_stanzas(path: str, fields: Tuple[bytes, ...]) -> List[Dict[bytes, bytes]]:
+    """Read a deb822 file and return the requested fields of every stanza."""
+    stanzas = []
+    current: Dict[bytes, bytes] = {}
+
+    with _open(path) as file:
+        for line in file:
+            if line == b"\n":
+                if current:
+                    stanzas.append(current)
+                    current = {}
+                continue
+            # Continuation lines start with whitespace and never hold the fields we need
+            if line[:1] in (b" ", b"\t"):
+                continue
+            name, sep, value = line.partition(b":")
+            if sep and name in fields:
+                current[name] = value.strip()
+
+    if current:
+        stanzas.append(current)
+    return stanzas
+
+
+class _VersionKey:
+    """Sort key ordering Debian versions like dpkg."""
+    __slots__ = ("version",)
+
+    def __init__(self, version: str) -> None:
+        self.version = version
+
+    def __lt__(self, other: "_VersionKey") -> bool:
+        return compare_versions(self.version, other.version) < 0
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, _VersionKey) and compare_versions(self.version, other.version) == 0
+
+
+class AptEngine:
+    """
+    Counts upgradable packages by reading the dpkg status file and the package
+    indexes under the apt lists directory, without spawning apt. Results are
+    memoized until one of those files changes.
+
+    The candidate of a package is picked like apt does with the default pin
+    priorities of its releases (NotAutomatic and ButAutomaticUpgrades in the
+    Release files), /etc/apt/preferences is not read.
+    """
+
+    def __init__(self, dpkg_status: str = DPKG_STATUS, lists_dir: str = APT_LISTS_DIR) -> None:
+        self.dpkg_status = dpkg_status
+        self.lists_dir = lists_dir
+        self._signature: Optional[Tuple] = None
+        self._counts: Optional[AptCounts] = None
+        self._lock = threading.Lock()
+
+    def _index_files(self) -> List[os.DirEntry]:
+        """Return the package index and Release files in the lists directory."""
+        with os.scandir(self.lists_dir) as entries:
+            files = sorted(
+                (entry for entry in entries if entry.is_file() and entry.name.endswith(INDEX_SUFFIXES + RELEASE_SUFFIXES)),
+                key=lambda entry: entry.name)
+        if lz4 is None and any(entry.name.endswith(".lz4") for entry in files):
+            logger.warning("lz4 is not installed, skipping the lz4 compressed package indexes")
+            files = [entry for entry in files if not entry.name.endswith(".lz4")]
+        return files
+
+    def _signature_of(self, index_files: List[os.DirEntry]) -> Tuple:
+        """Build a cache key from the size and mtime of every input file."""
+        status = os.stat(self.dpkg_status)
+        return ((status.st_mtime_ns, status.st_size),) + tuple(
+            (entry.name, entry.stat().st_mtime_ns, entry.stat().st_size) for entry in index_files)
+
+    def count(self) -> AptCounts:
+        """Return the upgradable package counts, re-reading the files only when they changed."""
+        with self._lock:
+            index_files = self._index_files()
+            signature = self._signature_of(index_files)
+            if signature != self._signature:
+                self._counts = self._compute(index_files)
+                self._signature = signature
+            return self._counts
+
+    def _installed(self) -> Dict[str, Dict[str, Tuple[str, bool]]]:
+        """Return installed packages as name -> architecture -> (version, held), multiarch packages have several."""
+        installed: Dict[str, Dict[str, Tuple[str, bool]]] = {}
+        for stanza in _read_stanzas(self.dpkg_status, (b"Package", b"Status", b"Architecture", b"Version")):
+            status = stanza.get(b"Status", b"").split()
+            if len(status) != 3 or status[2] != b"installed" or b"Version" not in stanza:
+                continue
+            installed.setdefault(stanza[b"Package"].decode(), {})[stanza.get(b"Architecture", b"").decode()] = (
+                stanza[b"Version"].decode(), status[0] == b"hold")
+        return installed
+
+    @staticmethod
+    def _release_info(release: Optional[os.DirEntry]) -> Tuple[int, bool]:
+        """Return the default pin priority of the versions in a release and whether it is a security suite."""
+        if release is None:
+            return PRIORITY_DEFAULT, False
+        fields: Dict[bytes, bytes] = {}
+        for stanza in _read_stanzas(release.path, (b"Suite", b"Codename", b"NotAutomatic", b"ButAutomaticUpgrades")):
+            fields.update(stanza)
+
+        # e.g. bookworm-security, jammy-security or the older stable/updates
+        security = any(fields.get(field, b"").decode(errors="replace").lower().endswith(("-security", "/updates"))
+                       for field in (b"Suite", b"Codename"))
+        if fields.get(b"NotAutomatic", b"").lower() != b"yes":
+            return PRIORITY_DEFAULT, security
+        if fields.get(b"ButAutomaticUpgrades", b"").lower() == b"yes":
+            return PRIORITY_BUT_AUTOMATIC, security
+        return PRIORITY_NOT_AUTOMATIC, security
+
+    def _compute(self, files: List[os.DirEntry]) -> AptCounts:
+        """Pick the candidate of every installed package from the indexes and compare it with the installed version."""
+        installed = self._installed()
+        index_files = [entry for entry in files if entry.name.endswith(INDEX_SUFFIXES)]
+        # Release file name without its suffix, an index belongs to the release with the longest matching prefix
+        releases = {entry.name[:-len(suffix)]: entry for entry in files for suffix in RELEASE_SUFFIXES if entry.name.endswith(suffix)}
+
+        # (name, architecture) -> version -> (priority, available from a security suite)
+        available: Dict[Tuple[str, str], Dict[str, Tuple[int, bool]]] = {}
+        # Every component and architecture of a suite has its own index, the Release file is read once
+        release_info: Dict[Optional[str], Tuple[int, bool]] = {}
+        for entry in index_files:
+            prefix = max((prefix for prefix in releases if entry.name.startswith(prefix + "_")), key=len, default=None)
+            if prefix not in release_info:
+                release_info[prefix] = self._release_info(releases.get(prefix))
+            priority, from_security = release_info[prefix]
+            for stanza in _read_stanzas(entry.path, (b"Package", b"Architecture", b"Version")):
+                name = stanza.get(b"Package", b"").decode()
+                if name not in installed or b"Version" not in stanza:
+                    continue
+                candidate_arch = stanza.get(b"Architecture", b"").decode()
+                version = stanza[b"Version"].decode()
+                for arch in installed[name]:
+                    if candidate_arch != arch and "all" not in (arch, candidate_arch):
+                        continue
+                    versions = available.setdefault((name, arch), {})
+                    known_priority, known_security = versions.get(version, (0, False))
+                    versions[version] = (max(priority, known_priority), from_security or known_security)
+
+        upgradable: Set[Tuple[str, str]] = set()
+        security: Set[Tuple[str, str]] = set()
+        held = 0
+        for key, versions in available.items():
+            installed_version, is_held = installed[key[0]][key[1]]
+            # Without a pin of 1000 or more apt never picks a version older than the installed one
+            candidates = {version: entry for version, entry in versions.items() if compare_versions(version, installed_version) > 0}
+            if not candidates:
+                continue
+            installed_priority = max(PRIORITY_INSTALLED, versions.get(installed_version, (0, False))[0])
+            version, (priority, from_security) = max(
+                candidates.items(), key=lambda item: (item[1][0], _VersionKey(item[0])))
+            if priority < installed_priority:
+                continue
+            upgradable.add(key)
+            held += is_held
+            if from_security:
+                security.add(key)
+
+        logger.debug(f"APT engine read {len(installed)} installed packages and {len(index_files)} index files")
+        return AptCounts(total=len(upgradable), security=len(security), held=held)
+
+
+# Global instance of AptEngine
+apt_engine = AptEngine()
@@ -0,0 +1,296 @@
+#!/usr/bin/python3
+
+import time
+import asyncio
+import functools
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Type
+from config import config
+from services.logger import logger
+from services.encoding import dumps, loads
+from services.snapshot import SharedSnapshot, default_path
+from services.timings import timings
+from services.models import (
+    CheckStatus,
+    IPStatus,
+    DiskSpaceStatus,
+    AptUpdateStatus,
+    LoadStatus,
+    MemoryStatus,
+    LoggedInUsersStatus,
+    ProcessStatus
+)
+from services.monitoring import (
+    check_ip,
+    check_disk,
+    check_apt_updates,
+    check_load,
+    check_memory,
+    check_logged_in_users,
+    check_processes
+)
+
+# Checks sampled by the collector, keyed by the name used in the config and routes
+CHECKS: Dict[str, Callable[[], Awaitable[CheckStatus]]] = {
+    "ip": check_ip,
+    "disk": check_disk,
+    "apt": check_apt_updates,
+    "load": check_load,
+    "memory": check_memory,
+    "users": check_logged_in_users,
+    "processes": check_processes,
+}
+
+# Result model of every check, used to rebuild samples read from the shared snapshot
+MODELS: Dict[str, Type[CheckStatus]] = {
+    "ip": IPStatus,
+    "disk": DiskSpaceStatus,
+    "apt": AptUpdateStatus,
+    "load": LoadStatus,
+    "memory": MemoryStatus,
+    "users": LoggedInUsersStatus,
+    "processes": ProcessStatus,
+}
+
+# Placeholder values served when a check misses its deadline before its first sample,
+# these match what the checks themselves return on failure
+FALLBACKS: Dict[str, Callable[[], CheckStatus]] = {
+    "ip": lambda: IPStatus(ip="-1"),
+    "disk": lambda: DiskSpaceStatus(disks={"error": {"free_percent": -1, "free_gb": -1}}),
+    "apt": lambda: AptUpdateStatus(total_updates=-1, critical_updates=-1, held_updates=-1),
+    "load": lambda: LoadStatus(load_1m=-1, load_5m=-1, load_15m=-1),
+    "memory": lambda: MemoryStatus(used_ram=-1, total_ram=-1, used_swap=-1, total_swap=-1),
+    "users": lambda: LoggedInUsersStatus(user_count=-1, usernames=[]),
+    "processes": lambda: ProcessStatus(processes={"error": False}),
+}
+
+# Used when a check has no interval or deadline configured
+DEFAULT_INTERVAL = 60.0
+DEFAULT_TIMEOUT = 10.0
+
+
+@dataclass(frozen=True)
+class Sample:
+    """A single collected check result."""
+    value: CheckStatus
+    sampled_at: float
+    collect_ms: float
+    version: int
+
+
+class Collector:
+    """
+    Samples every check on its own schedule into an in-memory snapshot,
+    so the routes never have to run a check themselves. The snapshot is fed
+    by the checks' coalescing caches, so a refresh started by any caller
+    updates it.
+
+    With several API workers one collector process shares its snapshot
+    through a SharedSnapshot, and the collector in every worker follows
+    that snapshot instead of running checks itself.
+    """
+
+    def __init__(self) -> None:
+        self.intervals: Dict[str, float] = {
+            name: float(config.collect_intervals.get(name, DEFAULT_INTERVAL)) for name in CHECKS}
+        self.timeouts: Dict[str, float] = {
+            name: float(config.check_timeouts.get(name, DEFAULT_TIMEOUT)) for name in CHECKS}
+        self.samples: Dict[str, Sample] = {}
+        self.version = 0
+        self._tasks: List[asyncio.Task] = []
+        # Called with the check name and sample after every stored sample
+        self._listeners: List[Callable[[str, Sample], None]] = []
+        # Shared snapshot this collector publishes to, or follows when following is set
+        self.shared: Optional[SharedSnapshot] = None
+        self.following = False
+        self.poll_interval = float(config.snapshot_poll_interval)
+        self._updated: Optional[asyncio.Condition] = None
+        self._refreshes: Set[asyncio.Task] = set()
+
+        # Every value stored in a check's cache becomes the new sample for that check
+        for name, check in CHECKS.items():
+            check.cache.on_update = functools.partial(self._store, name)
+
+    def share(self, snapshot: SharedSnapshot) -> None:
+        """Publish every new sample to a shared snapshot and serve the refresh requests of the workers."""
+        self.shared = snapshot
+        self.subscribe(lambda name, sample: self._publish())
+
+    def follow(self, snapshot: SharedSnapshot) -> None:
+        """Take samples from a shared snapshot instead of running the checks."""
+        self.shared = snapshot
+        self.following = True
+
+    async def start(self) -> None:
+        """Start one sample loop per check, each loop samples immediately."""
+        if self.following:
+            logger.info(f"Following the shared snapshot {self.shared.path}")
+            self._updated = asyncio.Condition()
+            self._tasks.append(asyncio.create_task(self._follow(), name="collector-follow"))
+            return
+
+        logger.info(f"Starting collector with intervals: {self.intervals}")
+        for name in CHECKS:
+            self._tasks.append(asyncio.create_task(self._run(name), name=f"collector-{name}"))
+        if self.shared:
+            self._tasks.append(asyncio.create_task(self._serve_requests(), name="collector-requests"))
+
+    async def stop(self) -> None:
+        """Cancel all sample loops."""
+        for task in self._tasks + list(self._refreshes):
+            task.cancel()
+        await asyncio.gather(*self._tasks, *self._refreshes, return_exceptions=True)
+        self._tasks.clear()
+        logger.info("Collector stopped")
+
+    async def _run(self, name: str) -> None:
+        """Sample a single check forever at its configured interval."""
+        while True:
+            try:
+                # Goes through the check's cache, a stale value is refreshed in the background
+                await CHECKS[name]()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Collector failed to sample {name}: {e}")
+            await asyncio.sleep(self.intervals[name])
+
+    def subscribe(self, listener: Callable[[str, Sample], None]) -> None:
+        """Register a function that is called with every new sample."""
+        self._listeners.append(listener)
+
+    def _store(self, name: str, value: CheckStatus) -> None:
+        """Store a freshly collected value as the latest sample of a check."""
+        self.version += 1
+        sample = Sample(value=value, sampled_at=value.sampled_at, collect_ms=value.collect_ms, version=self.version)
+        logger.debug(f"Collected {name} in {value.collect_ms} ms (version {self.version})")
+        self._apply(name, sample)
+
+    def _apply(self, name: str, sample: Sample) -> None:
+        """Make a sample the latest one of a check and notify the listeners."""
+        self.samples[name] = sample
+        for listener in self._listeners:
+            try:
+                listener(name, sample)
+            except Exception as e:
+                logger.error(f"Collector listener failed for {name}: {e}")
+
+    def _publish(self) -> None:
+        """Write all current samples to the shared snapshot."""
+        self.shared.publish(dumps({
+            name: {"value": sample.value, "version": sample.version} for name, sample in self.samples.items()
+        }))
+
+    async def _serve_requests(self) -> None:
+        """Refresh the checks that workers asked a fresher sample of, runs in the collector process."""
+        handled: Dict[str, float] = {}
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            for name, min_sampled_at in self.shared.requests().items():
+                if min_sampled_at <= handled.get(name, 0.0):
+                    continue
+                handled[name] = min_sampled_at
+                sample = self.samples.get(name)
+                if sample is None or sample.sampled_at < min_sampled_at:
+                    task = asyncio.create_task(CHECKS[name].cache.get(max(0.0, time.time() - min_sampled_at)))
+                    self._refreshes.add(task)
+                    task.add_done_callback(self._refreshes.discard)
+
+    async def _follow(self) -> None:
+        """Copy new samples from the shared snapshot, runs in every API worker."""
+        known = 0
+        while True:
+            try:
+                result = self.shared.read(known)
+                if result is not None:
+                    generation, payload = result
+                    entries = loads(payload)
+                    # Only a decoded snapshot counts as known, a bad read is retried on the next poll
+                    known = generation
+                    for name, entry in entries.items():
+                        current = self.samples.get(name)
+                        if current is None or current.version != entry["version"]:
+                            value = MODELS[name].model_validate(entry["value"])
+                            self.version = max(self.version, entry["version"])
+                            self._apply(name, Sample(value=value, sampled_at=value.sampled_at,
+                                                     collect_ms=value.collect_ms, version=entry["version"]))
+                            # The checks run in the collector process, keep their timings here as well
+                            if value.collect_ms is not None:
+                                timings.record(f"check.{name}", value.collect_ms, value.error is not None)
+                    async with self._updated:
+                        self._updated.notify_all()
+            except Exception as e:
+                logger.error(f"Failed to read the shared snapshot: {e}")
+            await asyncio.sleep(self.poll_interval)
+
+    async def _wait_shared(self, name: str, max_age: Optional[float]) -> Sample:
+        """Wait until the shared snapshot has a sample of a check that is at most max_age seconds old."""
+        min_sampled_at = time.time() - max_age if max_age is not None else 0.0
+        if max_age is not None:
+            self.shared.request(name, min_sampled_at)
+
+        def fresh() -> bool:
+            sample = self.samples.get(name)
+            return sample is not None and sample.sampled_at >= min_sampled_at
+
+        async with self._updated:
+            await asyncio.wait_for(self._updated.wait_for(fresh), self.timeouts[name])
+        return self.samples[name]
+
+    async def get(self, name: str, max_age: Optional[float] = None) -> Sample:
+        """
+        Return the latest sample for a check. The check is run first when
+        there is no sample yet or when it is older than max_age seconds.
+        """
+        sample = self.samples.get(name)
+        if sample is None or (max_age is not None and time.time() - sample.sampled_at > max_age):
+            if self.following:
+                return await self._wait_shared(name, max_age)
+            value = await CHECKS[name].cache.get(max_age)
+            # A failed refresh is not stored, but the caller still gets to see it
+            sample = self.samples.get(name)
+            if sample is None or sample.value is not value:
+                return self._unversioned(value)
+        return sample
+
+    def _unversioned(self, value: CheckStatus) -> Sample:
+        """Wrap a value that is not part of the snapshot, version 0 marks it as such."""
+        return Sample(value=value, sampled_at=value.sampled_at, collect_ms=value.collect_ms, version=0)
+
+    async def read(self, name: str, max_age: Optional[float] = None) -> Sample:
+        """
+        Return the latest sample for a check, waiting at most the check's deadline
+        for a refresh. On timeout the last value (or a placeholder) is returned
+        marked as timed out, the refresh keeps running and updates the snapshot.
+        """
+        try:
+            # Shield the refresh so a missed deadline does not cancel it for other callers
+            return await asyncio.wait_for(asyncio.shield(self.get(name, max_age)), self.timeouts[name])
+
+        except asyncio.TimeoutError:
+            logger.warning(f"Check {name} did not finish within {self.timeouts[name]} seconds")
+            sample = self.samples.get(name)
+            value = sample.value if sample else FALLBACKS[name]()
+            return self._unversioned(value.model_copy(update={"timed_out": True}))
+
+        except Exception as e:
+            logger.error(f"Failed to collect {name}: {e}")
+            return self._unversioned(FALLBACKS[name]().model_copy(update={"error": str(e)}))
+
+    async def read_many(self, names: List[str], max_age: Optional[float] = None) -> Dict[str, Sample]:
+        """Read several checks concurrently, each bounded by its own deadline."""
+        samples = await asyncio.gather(*(self.read(name, max_age) for name in names))
+        return dict(zip(names, samples))
+
+    def remaining(self, sample: Sample, name: str) -> int:
+        """Seconds until the collector takes the next sample of a check."""
+        if sample.sampled_at is None:
+            return 0
+        return max(0, int(self.intervals[name] - (time.time() - sample.sampled_at)))
+
+
+# Global instance of Collector
+collector = Collector()
+
+# Snapshot shared between the collector process and the API workers when running with several workers
+shared_snapshot = SharedSnapshot(config.snapshot_file or default_path(), int(config.snapshot_size), list(CHECKS))
@@ -1,14 +1,20 @@
 #!/usr/bin/python3
 
 import os
+import time
 import sqlite3
+import threading
 import bcrypt
-from typing import Optional, Dict, Any
+from cachetools import LRUCache
+from typing import Optional, Dict, Any, Tuple
 from config import config
 from services.logger import logger
 
 DB_FILE: str = config.db_name
 
+# Most user lookups kept in memory, unknown usernames are cached as well
+USER_CACHE_SIZE = 1024
+
 
 def init_db() -> None:
     """Check if database exists; if not, create users table."""
@@ -67,18 +73,96 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
         return False
 
 
+class UserStore:
+    """
+    User lookups over one long-lived SQLite connection in WAL mode, with a
+    read-through cache in front of it. The cache is dropped when a user is
+    added, or when the database files change on disk (e.g. a user added by
+    another process), which is checked at most every check_interval seconds.
+    """
+
+    def __init__(self, path: str, check_interval: float) -> None:
+        self.path = path
+        self.check_interval = check_interval
+        self._conn: Optional[sqlite3.Connection] = None
+        self._cache: LRUCache = LRUCache(maxsize=USER_CACHE_SIZE)
+        self._signature: Optional[Tuple] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        """Return the shared connection, opening it on first use."""
+        if self._conn is None:
+            # The sqlite3 statement cache keeps the few queries below prepared
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, cached_statements=16)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            logger.debug(f"Opened user database {self.path}")
+        return self._conn
+
+    def _signature_of(self) -> Tuple:
+        """Return the mtime and size of the database and its write-ahead log."""
+        signature = []
+        for path in (self.path, self.path + "-wal"):
+            try:
+                stat = os.stat(path)
+                signature.append((stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                signature.append(None)
+        return tuple(signature)
+
+    def _check_files(self) -> None:
+        """Drop the cache when the database files changed since the last check."""
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        signature = self._signature_of()
+        if signature != self._signature:
+            if self._signature is not None:
+                logger.info("User database changed on disk, clearing the user cache")
+            self._cache.clear()
+            self._signature = signature
+
+    def get(self, username: str) -> Optional[Dict[str, Any]]:
+        """Return the user from the cache, or read it from the database."""
+        with self._lock:
+            self._check_files()
+            if username in self._cache:
+                return self._cache[username]
+            row = self._connection().execute(
+                "SELECT username, hashed_password FROM users WHERE username = ?", (username,)).fetchone()
+            user = {"username": row[0], "hashed_password": row[1]} if row else None
+            self._cache[username] = user
+            return user
+
+    def insert(self, username: str, hashed_password: str) -> None:
+        """Insert a user and invalidate the cache, raises sqlite3.IntegrityError for an existing user."""
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute("INSERT INTO users (username, hashed_password) VALUES (?, ?)", (username, hashed_password))
+            self._cache.clear()
+            self._signature = self._signature_of()
+
+    def close(self) -> None:
+        """Close the shared connection."""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+# Global instance of UserStore
+user_store = UserStore(DB_FILE, float(config.user_cache_check_interval))
+
+
 def add_user(username: str, password: str) -> None:
     """Add a new user to the database with a hashed password."""
     try:
         # Hash the user's password
         hashed_pwd = hash_password(password)
-        with sqlite3.connect(DB_FILE) as conn:
-            cursor = conn.cursor()
-            # Insert the user into the database
-            cursor.execute(
-                "INSERT INTO users (username, hashed_password) VALUES (?, ?)", (username, hashed_pwd))
-            # Commit changes to the database
-            conn.commit()
+        user_store.insert(username, hashed_pwd)
         logger.info(f"User '{username}' added successfully!")
     except sqlite3.IntegrityError:
         logger.warning(f"User '{username}' already exists.")
@@ -87,19 +171,9 @@ def add_user(username: str, password: str) -> None:
 
 
 def get_user(username: str) -> Optional[Dict[str, Any]]:
-    """Retrieve user information (username and hashed password) from the database."""
+    """Retrieve user information (username and hashed password), cached in memory."""
     try:
-        # Connect to the database
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        # Query the database for the specified user
-        cursor.execute(
-            "SELECT username, hashed_password FROM users WHERE username = ?", (username,))
-        user = cursor.fetchone()
-        conn.close()
-
-        # Return user data if found, otherwise return None
-        return {"username": user[0], "hashed_password": user[1]} if user else None
+        return user_store.get(username)
     except Exception as e:
         logger.error(f"Error retrieving user '{username}': {str(e)}")
         return None
@@ -0,0 +1,130 @@
+#!/usr/bin/python3
+
+import os
+import re
+import threading
+from fnmatch import fnmatchcase
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Set
+from config import config
+from services.logger import logger
+
+MOUNTINFO = "/proc/self/mountinfo"
+
+GB = 1024 ** 3
+
+# Mount points escape spaces, tabs, newlines and backslashes as octal
+_ESCAPE = re.compile(r"\\([0-7]{3})")
+
+
+@dataclass(frozen=True)
+class Mount:
+    mount_point: str
+    device: str
+    fstype: str
+
+
+def _unescape(value: str) -> str:
+    return _ESCAPE.sub(lambda match: chr(int(match.group(1), 8)), value)
+
+
+def parse_mountinfo(data: bytes) -> Dict[str, Mount]:
+    """Parse mountinfo into mount point -> Mount, a mount stacked on top of another one wins."""
+    mounts = {}
+    for line in data.decode(errors="replace").splitlines():
+        fields = line.split(" ")
+        try:
+            # Optional fields end with a single -, the filesystem type follows it
+            separator = fields.index("-", 6)
+            mount_point = _unescape(fields[4])
+            mounts[mount_point] = Mount(mount_point, fields[2], fields[separator + 1])
+        except (ValueError, IndexError):
+            logger.debug(f"Skipping unparsable mountinfo line: {line}")
+    return mounts
+
+
+class DiskEngine:
+    """
+    Tracks the mounts matching the monitored globs and filesystem types.
+    mountinfo is read on every pass but only parsed and filtered again when
+    it changed, so new mounts show up without a restart. Usage is read with
+    one statvfs per device, mounts of the same filesystem share the result.
+    """
+
+    def __init__(self, patterns: List[str], fstypes: Set[str], exclude_fstypes: Set[str], mountinfo: str = MOUNTINFO) -> None:
+        # Mount points have no trailing slash, except the root
+        self.patterns = [pattern.strip().rstrip("/") or "/" for pattern in patterns if pattern.strip()]
+        self.fstypes = fstypes
+        self.exclude_fstypes = exclude_fstypes
+        self.mountinfo = mountinfo
+        self.tracked: List[Mount] = []
+        self._raw: Optional[bytes] = None
+        self._lock = threading.Lock()
+
+    def _matches(self, mount: Mount) -> bool:
+        """Whether a mount passes the filesystem type filters and one of the globs."""
+        if self.fstypes and mount.fstype not in self.fstypes:
+            return False
+        if mount.fstype in self.exclude_fstypes:
+            return False
+        return any(fnmatchcase(mount.mount_point, pattern) for pattern in self.patterns)
+
+    def _refresh(self) -> None:
+        """Re-read mountinfo and rebuild the tracked mounts when it changed."""
+        with open(self.mountinfo, "rb") as f:
+            raw = f.read()
+        if raw == self._raw:
+            return
+
+        mounts = parse_mountinfo(raw)
+        self.tracked = sorted((mount for mount in mounts.values() if self._matches(mount)), key=lambda mount: mount.mount_point)
+        self._raw = raw
+
+        # A monitored path without glob characters is expected to be mounted
+        for pattern in self.patterns:
+            if not any(char in pattern for char in "*?[") and pattern not in mounts:
+                logger.warning(f"Monitored disk {pattern} is not mounted")
+        logger.info(f"Tracking {len(self.tracked)} of {len(mounts)} mounts: {', '.join(mount.mount_point for mount in self.tracked)}")
+
+    def usage(self) -> Dict[str, Dict[str, Any]]:
+        """Return the usage of every tracked mount, runs in the probe executor."""
+        with self._lock:
+            self._refresh()
+            tracked = self.tracked
+
+        by_device: Dict[str, Dict[str, Optional[float]]] = {}
+        disks: Dict[str, Dict[str, Any]] = {}
+        for mount in tracked:
+            if mount.device not in by_device:
+                try:
+                    by_device[mount.device] = self._statvfs(mount.mount_point)
+                except OSError as e:
+                    logger.warning(f"Skipping disk {mount.mount_point}: {e}")
+                    continue
+            disks[mount.mount_point] = dict(by_device[mount.device], fstype=mount.fstype)
+        return disks
+
+    @staticmethod
+    def _statvfs(path: str) -> Dict[str, Optional[float]]:
+        """Free space and inodes of the filesystem at path, percentages as psutil reports them."""
+        st = os.statvfs(path)
+        free = st.f_bavail * st.f_frsize
+        used = (st.f_blocks - st.f_bfree) * st.f_frsize
+        # Space reserved for root counts as used, like df and psutil.disk_usage
+        used_percent = round(used / (used + free) * 100, 1) if used + free else 0.0
+        return {
+            "free_percent": 100 - used_percent,
+            "free_gb": free / GB,
+            "free_bytes": free,
+            # Filesystems like btrfs report no inode limit
+            "inodes_free": st.f_favail if st.f_files else None,
+            "inodes_free_percent": round(st.f_favail / st.f_files * 100, 1) if st.f_files else None,
+        }
+
+
+def _fstypes(value: str) -> Set[str]:
+    return {fstype.strip() for fstype in value.split(",") if fstype.strip()}
+
+
+# Global instance of DiskEngine
+disk_engine = DiskEngine(config.monitored_disks, _fstypes(config.disk_fstypes), _fstypes(config.disk_exclude_fstypes))
@@ -0,0 +1,85 @@
+#!/usr/bin/python3
+
+import json
+import time
+from typing import Any, Callable, Dict, Tuple
+from pydantic import BaseModel
+from fastapi import Response
+from fastapi.responses import JSONResponse
+from services.logger import logger
+from services.timings import timings
+
+# orjson is optional, the standard library encoder is used when it is not installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+    logger.warning("orjson is not installed, the fast JSON path falls back to the json module")
+
+
+def _default(obj: Any) -> Any:
+    """Encode models by their field values, they come from trusted collector data."""
+    if isinstance(obj, BaseModel):
+        return obj.__dict__
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    """Encode content, including nested models, to compact JSON bytes."""
+    start = time.perf_counter()
+    if orjson is not None:
+        body = orjson.dumps(content, default=_default)
+    else:
+        body = json.dumps(content, default=_default, separators=(",", ":")).encode("utf-8")
+    timings.record("encode", (time.perf_counter() - start) * 1000)
+    return body
+
+
+def loads(data: bytes) -> Any:
+    """Decode JSON bytes."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class FastJSONResponse(Response):
+    """JSON response that skips FastAPI's response model validation and generic encoder."""
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        return dumps(content)
+
+
+class TimedJSONResponse(JSONResponse):
+    """FastAPI's default JSON response, recording the time spent rendering the body under encode as well."""
+
+    def render(self, content: Any) -> bytes:
+        start = time.perf_counter()
+        body = super().render(content)
+        timings.record("encode", (time.perf_counter() - start) * 1000)
+        return body
+
+
+class EncodedCache:
+    """Keeps the encoded body of the latest version per key, so unchanged snapshots are encoded once."""
+
+    def __init__(self) -> None:
+        self._bodies: Dict[str, Tuple[int, bytes]] = {}
+
+    def get(self, key: str, version: int, build: Callable[[], Any]) -> bytes:
+        """Return the encoded content, only calling build on a miss. Version 0 is never cached."""
+        if version:
+            cached = self._bodies.get(key)
+            if cached and cached[0] == version:
+                return cached[1]
+
+        body = dumps(build())
+        if version:
+            self._bodies[key] = (version, body)
+        return body
+
+
+# Global instance of EncodedCache
+encoded_cache = EncodedCache()
@@ -0,0 +1,111 @@
+#!/usr/bin/python3
+
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, TypeVar
+from config import config
+from services.logger import logger
+
+T = TypeVar("T")
+
+
+class ProbeExecutor:
+    """
+    Bounded thread pool for blocking probes (psutil, filesystem calls), so they
+    never run on the event loop. Keeps per-probe stats of how long each call
+    waited for a worker and how long it held one.
+    """
+
+    def __init__(self, workers: int, thread_name_prefix: str = "probe") -> None:
+        self.workers = workers
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=thread_name_prefix)
+        self.stats: Dict[str, Dict[str, float]] = {}
+        self._stats_lock = threading.Lock()
+
+    async def run(self, name: str, func: Callable[..., T], *args: Any) -> T:
+        """Run a blocking function in the pool and return its result."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._pool, self._timed, name, time.perf_counter(), func, *args)
+
+    def _timed(self, name: str, submitted: float, func: Callable[..., T], *args: Any) -> T:
+        """Execute the probe on a worker thread and record its wait and hold time."""
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            self._record(name, (start - submitted) * 1000, (time.perf_counter() - start) * 1000)
+
+    def _record(self, name: str, wait_ms: float, hold_ms: float) -> None:
+        """Update the stats for a probe, runs on the worker thread."""
+        with self._stats_lock:
+            stats = self.stats.setdefault(name, {"count": 0, "wait_ms_total": 0.0, "hold_ms_total": 0.0, "hold_ms_max": 0.0, "hold_ms_last": 0.0})
+            stats["count"] += 1
+            stats["wait_ms_total"] += wait_ms
+            stats["hold_ms_total"] += hold_ms
+            stats["hold_ms_max"] = max(stats["hold_ms_max"], hold_ms)
+            stats["hold_ms_last"] = hold_ms
+        logger.debug(f"Probe {name} waited {wait_ms:.3f} ms and held a worker for {hold_ms:.3f} ms")
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Return the probe stats with averages, rounded for display."""
+        result = {}
+        with self._stats_lock:
+            stats_items = [(name, dict(stats)) for name, stats in self.stats.items()]
+        for name, stats in stats_items:
+            count = stats["count"] or 1
+            result[name] = {
+                "count": stats["count"],
+                "wait_ms_avg": round(stats["wait_ms_total"] / count, 3),
+                "hold_ms_avg": round(stats["hold_ms_total"] / count, 3),
+                "hold_ms_max": round(stats["hold_ms_max"], 3),
+                "hold_ms_last": round(stats["hold_ms_last"], 3),
+            }
+        return result
+
+    def shutdown(self) -> None:
+        """Stop the pool, running probes are allowed to finish."""
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+class ExecutorFull(Exception):
+    """Raised when a bounded executor has no room left for another call."""
+
+
+class BoundedExecutor(ProbeExecutor):
+    """
+    Executor with a bounded admission queue. Calls beyond the running workers
+    plus max_pending waiting ones are rejected right away instead of queueing
+    without limit, so a burst of expensive work can not pile up.
+    """
+
+    def __init__(self, workers: int, max_pending: int, thread_name_prefix: str) -> None:
+        super().__init__(workers, thread_name_prefix)
+        self.max_pending = max_pending
+        self.admitted = 0
+        self.rejected = 0
+
+    async def run(self, name: str, func: Callable[..., T], *args: Any) -> T:
+        """Run a blocking function in the pool, raises ExecutorFull when the queue is full."""
+        if self.admitted >= self.workers + self.max_pending:
+            self.rejected += 1
+            raise ExecutorFull(f"{self.admitted} calls running or queued")
+        self.admitted += 1
+        try:
+            return await super().run(name, func, *args)
+        finally:
+            self.admitted -= 1
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Return the call stats plus the admission state."""
+        result = super().snapshot()
+        result["admission"] = {"admitted": self.admitted, "limit": self.workers + self.max_pending, "rejected": self.rejected}
+        return result
+
+
+# Global instance of ProbeExecutor
+probe_executor = ProbeExecutor(int(config.probe_workers))
+
+# Global executor for bcrypt hashing and verification
+password_executor = BoundedExecutor(int(config.bcrypt_workers), int(config.bcrypt_queue_size), "bcrypt")
@@ -0,0 +1,256 @@
+#!/usr/bin/python3
+
+import time
+import asyncio
+import aiohttp
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+from urllib.parse import urlparse
+from config import config
+from services.logger import logger
+from services.encoding import dumps, loads
+from services.snapshot import SharedSnapshot, default_path
+from services.timings import timings
+
+# Failing nodes are retried less often, up to once every this many poll intervals
+MAX_BACKOFF_ROUNDS = 8
+
+
+def parse_nodes(value: str) -> Dict[str, str]:
+    """
+    Parse the fleet nodes as comma-separated name=url items, or read them one
+    per line from a file when the value starts with @. A node without a name
+    is named after the host of its URL. Raises ValueError naming the first
+    item that is not a valid node.
+    """
+    if value.startswith("@"):
+        with open(value[1:]) as f:
+            items = [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+    else:
+        items = [item.strip() for item in value.split(",") if item.strip()]
+
+    nodes = {}
+    for item in items:
+        name, url = item.split("=", 1) if "=" in item else ("", item)
+        url = url.strip().rstrip("/")
+        parsed = urlparse(url)
+        if parsed.scheme not in ("http", "https") or not parsed.hostname:
+            raise ValueError(f"Invalid fleet node '{item}': expected name=http(s)://host:port or http(s)://host:port")
+        name = name.strip() or parsed.hostname
+        if name in nodes:
+            raise ValueError(f"Invalid fleet node '{item}': the name {name} is used twice")
+        nodes[name] = url
+    return nodes
+
+
+@dataclass
+class FleetNode:
+    """One upstream monitoring API and the last status it returned."""
+    name: str
+    url: str
+    token: Optional[str] = None
+    etag: Optional[str] = None
+    status: Optional[Dict[str, Any]] = None
+    fetched_at: Optional[float] = None
+    latency_ms: Optional[float] = None
+    error: Optional[str] = None
+    failures: int = 0
+    retry_at: float = 0.0
+
+
+class Fleet:
+    """
+    Aggregates the status of many monitoring APIs. Every poll interval the
+    nodes are polled concurrently, at most FLEET_CONCURRENCY at a time and
+    each within FLEET_TIMEOUT, over one pooled session. Tokens and ETags are
+    kept per node, so a poll is normally one conditional GET without a login.
+    The routes only read the cached results, so a dead node never slows
+    them down; it is reported as stale and polled less often.
+
+    With several workers only the collector process polls, it publishes the
+    state of the nodes to a shared snapshot that the workers read from.
+    """
+
+    def __init__(self, nodes: Dict[str, str]) -> None:
+        self.nodes = {name: FleetNode(name, url) for name, url in nodes.items()}
+        self.interval = float(config.fleet_poll_interval)
+        self.timeout = float(config.fleet_timeout)
+        self.stale_after = float(config.fleet_stale_after)
+        self.concurrency = int(config.fleet_concurrency)
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._task: Optional[asyncio.Task] = None
+        # Snapshot the polled state is published to (collector process) or read from (workers)
+        self._publish_to: Optional[SharedSnapshot] = None
+        self._followed: Optional[SharedSnapshot] = None
+        self._known = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.nodes)
+
+    def share(self, snapshot: SharedSnapshot) -> None:
+        """Publish the state of the nodes to a shared snapshot after every poll, used by the collector process."""
+        self._publish_to = snapshot
+
+    def follow(self, snapshot: SharedSnapshot) -> None:
+        """Read the state of the nodes from a shared snapshot instead of polling, used by the API workers."""
+        self._followed = snapshot
+
+    async def start(self) -> None:
+        """Open the pooled session and start polling, does nothing without nodes or when following a snapshot."""
+        if not self.enabled or self._task is not None or self._followed is not None:
+            return
+        if not config.fleet_username or not config.fleet_password:
+            logger.warning("FLEET_USERNAME or FLEET_PASSWORD is not set, fleet nodes will refuse the aggregator")
+
+        # Keep connections open between polls, one per node is enough
+        connector = aiohttp.TCPConnector(
+            limit=self.concurrency,
+            limit_per_host=1,
+            ttl_dns_cache=int(config.http_dns_cache_ttl),
+            keepalive_timeout=self.interval * 2
+        )
+        self._session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout))
+        self._task = asyncio.create_task(self._run(), name="fleet")
+        logger.info(f"Fleet aggregator started for {len(self.nodes)} nodes (concurrency: {self.concurrency})")
+
+    async def stop(self) -> None:
+        """Stop polling and close the session."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _run(self) -> None:
+        """Poll all due nodes every interval."""
+        while True:
+            start = time.monotonic()
+            try:
+                await self.poll()
+                if self._publish_to is not None:
+                    self._publish()
+            except Exception as e:
+                logger.error(f"Fleet poll failed: {e}")
+            await asyncio.sleep(max(0.0, self.interval - (time.monotonic() - start)))
+
+    async def poll(self) -> None:
+        """Poll every node that is not backing off, with bounded concurrency."""
+        semaphore = asyncio.Semaphore(self.concurrency)
+        now = time.monotonic()
+        due = [node for node in self.nodes.values() if node.retry_at <= now]
+
+        async def guarded(node: FleetNode) -> None:
+            async with semaphore:
+                await self._poll_node(node)
+
+        await asyncio.gather(*[guarded(node) for node in due])
+        stale = sum(1 for node in self.nodes.values() if self.is_stale(node))
+        logger.debug(f"Polled {len(due)} of {len(self.nodes)} fleet nodes, {stale} stale")
+
+    async def _poll_node(self, node: FleetNode) -> None:
+        """Fetch the status of one node and record the outcome."""
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._fetch(node), self.timeout)
+            node.error = None
+            node.failures = 0
+            node.fetched_at = time.time()
+        except Exception as e:
+            node.error = str(e) or type(e).__name__
+            node.failures += 1
+            # Retry in the next round at first, then back off exponentially
+            node.retry_at = time.monotonic() + self.interval * (min(2 ** (node.failures - 1), MAX_BACKOFF_ROUNDS) - 1)
+            logger.warning(f"Fleet node {node.name} failed ({node.failures} in a row): {node.error}")
+        node.latency_ms = round((time.perf_counter() - start) * 1000, 3)
+        timings.record("fleet.poll", node.latency_ms, node.error is not None)
+
+    async def _login(self, node: FleetNode) -> None:
+        """Get a new token from a node."""
+        data = {"username": config.fleet_username or "", "password": config.fleet_password or ""}
+        async with self._session.post(f"{node.url}/api/auth/token", data=data) as response:
+            if response.status != 200:
+                raise RuntimeError(f"Login failed with HTTP {response.status}")
+            node.token = loads(await response.read())["access_token"]
+
+    async def _fetch(self, node: FleetNode) -> None:
+        """Get the full status of a node, logging in again once when its token was refused."""
+        for attempt in range(2):
+            if node.token is None:
+                await self._login(node)
+
+            headers = {"Authorization": f"Bearer {node.token}"}
+            if node.etag and node.status is not None:
+                headers["If-None-Match"] = node.etag
+
+            async with self._session.get(f"{node.url}/api/status/all", headers=headers) as response:
+                if response.status == 401 and attempt == 0:
+                    node.token = None
+                    continue
+                if response.status == 304:
+                    return
+                if response.status != 200:
+                    raise RuntimeError(f"HTTP {response.status}")
+                node.status = loads(await response.read())
+                node.etag = response.headers.get("ETag")
+                return
+
+    def _publish(self) -> None:
+        """Write the state of every node to the shared snapshot."""
+        self._publish_to.publish(dumps({
+            name: {"fetched_at": node.fetched_at, "latency_ms": node.latency_ms, "error": node.error, "status": node.status}
+            for name, node in self.nodes.items()
+        }))
+
+    def sync(self) -> None:
+        """Copy the state of the nodes from the shared snapshot when the collector process published a newer one."""
+        if self._followed is None:
+            return
+        result = self._followed.read(self._known)
+        if result is None:
+            return
+        generation, payload = result
+        for name, state in loads(payload).items():
+            node = self.nodes.get(name)
+            if node is not None:
+                node.fetched_at = state["fetched_at"]
+                node.latency_ms = state["latency_ms"]
+                node.error = state["error"]
+                node.status = state["status"]
+        self._known = generation
+
+    def is_stale(self, node: FleetNode) -> bool:
+        """Whether a node had no successful poll within FLEET_STALE_AFTER."""
+        return node.fetched_at is None or time.time() - node.fetched_at > self.stale_after
+
+    def node_view(self, node: FleetNode) -> Dict[str, Any]:
+        """Return the cached state of one node."""
+        return {
+            "url": node.url,
+            "stale": self.is_stale(node),
+            "fetched_at": node.fetched_at,
+            "latency_ms": node.latency_ms,
+            "error": node.error,
+            "status": node.status,
+        }
+
+    def view(self) -> Dict[str, Any]:
+        """Return the cached state of all nodes with a count of stale ones."""
+        nodes = {name: self.node_view(node) for name, node in self.nodes.items()}
+        return {
+            "total": len(nodes),
+            "stale": sum(1 for node in nodes.values() if node["stale"]),
+            "nodes": nodes,
+        }
+
+
+# Global instance of Fleet
+fleet = Fleet(parse_nodes(config.fleet_nodes))
+
+# Polled fleet state shared by the collector process with the workers, next to the collector snapshot
+fleet_snapshot = SharedSnapshot(f"{config.snapshot_file or default_path()}-fleet", int(config.snapshot_size), [])
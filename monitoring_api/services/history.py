@@ -0,0 +1,202 @@
+#!/usr/bin/python3
+
+import time
+import math
+import asyncio
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+from config import config
+from services.logger import logger
+from services.models import CheckStatus
+
+# Stored resolutions in seconds, 0 is the raw samples
+RESOLUTIONS = [0, 60, 3600, 86400]
+RESOLUTION_NAMES = {"raw": 0, "1m": 60, "1h": 3600, "1d": 86400}
+
+# Queries without a step are answered with at most this many points
+MAX_POINTS = 1000
+
+# How often old rows are compacted away
+COMPACT_INTERVAL = 3600
+
+
+def numeric_fields(check: str, value: CheckStatus) -> Dict[str, float]:
+    """Flatten the numeric values of a check result into metric name -> value."""
+    data = value.model_dump(exclude={"sampled_at", "collect_ms", "timed_out", "error"})
+    metrics = {}
+
+    if check == "disk":
+        for mount, usage in data["disks"].items():
+            if isinstance(usage, dict):
+                for key, number in usage.items():
+                    if isinstance(number, (int, float)):
+                        metrics[f"disk.{mount}.{key}"] = float(number)
+    elif check == "processes":
+        for process, running in data["processes"].items():
+            metrics[f"processes.{process}"] = 1.0 if running else 0.0
+    else:
+        for key, number in data.items():
+            if isinstance(number, (int, float)) and not isinstance(number, bool):
+                metrics[f"{check}.{key}"] = float(number)
+    return metrics
+
+
+class HistoryStore:
+    """
+    Embedded time-series store for collector samples. Samples are buffered and
+    written in batches to SQLite (WAL mode), and every write also updates the
+    1 minute, 1 hour and 1 day rollups in place, so queries never rescan raw data.
+    """
+
+    def __init__(self, path: str, retention: Dict[str, float], flush_interval: float) -> None:
+        self.path = path
+        self.retention = {RESOLUTION_NAMES[name]: seconds for name, seconds in retention.items() if name in RESOLUTION_NAMES}
+        self.flush_interval = flush_interval
+        self._buffer: List[Tuple[str, float, float]] = []
+        self._conn: Optional[sqlite3.Connection] = None
+        # SQLite work runs on one dedicated thread so it never blocks the event loop
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="history")
+        self._task: Optional[asyncio.Task] = None
+
+    def _open(self) -> None:
+        """Open the database and create the table, runs on the history thread."""
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS history (
+                metric TEXT NOT NULL,
+                step INTEGER NOT NULL,
+                ts REAL NOT NULL,
+                count INTEGER NOT NULL,
+                sum REAL NOT NULL,
+                min REAL NOT NULL,
+                max REAL NOT NULL,
+                PRIMARY KEY (metric, step, ts)
+            ) WITHOUT ROWID
+        """)
+        self._conn.commit()
+
+    async def _run(self, func, *args) -> Any:
+        """Run a database function on the history thread."""
+        return await asyncio.get_running_loop().run_in_executor(self._pool, func, *args)
+
+    async def start(self, maintain: bool = True) -> None:
+        """Open the store and start the periodic flush and compaction, API workers that only query skip the latter."""
+        await self._run(self._open)
+        if maintain:
+            self._task = asyncio.create_task(self._loop(), name="history")
+        logger.info(f"History store opened at {self.path}")
+
+    async def stop(self) -> None:
+        """Flush what is buffered and close the store."""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        await self.flush()
+        if self._conn:
+            await self._run(self._conn.close)
+            self._conn = None
+        self._pool.shutdown(wait=True)
+        logger.info("History store closed")
+
+    async def _loop(self) -> None:
+        """Flush the buffer every flush interval and compact once in a while."""
+        last_compact = 0.0
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+                if time.time() - last_compact >= COMPACT_INTERVAL:
+                    await self._run(self._compact)
+                    last_compact = time.time()
+            except Exception as e:
+                logger.error(f"History store maintenance failed: {e}")
+
+    def record(self, check: str, value: CheckStatus) -> None:
+        """Buffer the numeric values of a collected sample, failed samples are skipped."""
+        if value.error is not None or value.sampled_at is None:
+            return
+        for metric, number in numeric_fields(check, value).items():
+            self._buffer.append((metric, value.sampled_at, number))
+
+    async def flush(self) -> None:
+        """Write the buffered samples in one transaction."""
+        if not self._buffer or self._conn is None:
+            return
+        batch, self._buffer = self._buffer, []
+        await self._run(self._write, batch)
+
+    def _write(self, batch: List[Tuple[str, float, float]]) -> None:
+        """Insert raw samples and fold them into the rollups, runs on the history thread."""
+        rows = []
+        for metric, ts, number in batch:
+            for step in RESOLUTIONS:
+                bucket = ts if step == 0 else math.floor(ts / step) * step
+                rows.append((metric, step, bucket, number, number, number))
+
+        with self._conn:
+            self._conn.executemany("""
+                INSERT INTO history (metric, step, ts, count, sum, min, max) VALUES (?, ?, ?, 1, ?, ?, ?)
+                ON CONFLICT (metric, step, ts) DO UPDATE SET
+                    count = count + 1,
+                    sum = sum + excluded.sum,
+                    min = min(min, excluded.min),
+                    max = max(max, excluded.max)
+            """, rows)
+        logger.debug(f"History store wrote {len(batch)} samples")
+
+    def _compact(self) -> None:
+        """Delete rows that are past the retention of their resolution, runs on the history thread."""
+        now = time.time()
+        with self._conn:
+            for step, seconds in self.retention.items():
+                self._conn.execute("DELETE FROM history WHERE step = ? AND ts < ?", (step, now - seconds))
+        logger.info("History store compacted")
+
+    def pick_resolution(self, start: float, end: float, step: Optional[float]) -> int:
+        """
+        Pick the coarsest stored resolution that is still fine enough for the
+        requested step (or for MAX_POINTS points) and still covers the start.
+        """
+        wanted = step if step else (end - start) / MAX_POINTS
+        oldest_needed = time.time() - start
+        candidates = [res for res in RESOLUTIONS if self.retention.get(res, math.inf) >= oldest_needed]
+        if not candidates:
+            return RESOLUTIONS[-1]
+        fitting = [res for res in candidates if res <= wanted]
+        return fitting[-1] if fitting else candidates[0]
+
+    def _query(self, metric: str, start: float, end: float, resolution: int, step: int) -> List[Dict[str, float]]:
+        """Read the rollup rows for a range and merge them into step sized buckets, runs on the history thread."""
+        cursor = self._conn.execute("""
+            SELECT CAST(ts / ? AS INTEGER) * ? AS bucket, SUM(count), SUM(sum), MIN(min), MAX(max)
+            FROM history
+            WHERE metric = ? AND step = ? AND ts >= ? AND ts <= ?
+            GROUP BY bucket ORDER BY bucket
+        """, (step, step, metric, resolution, start, end))
+        return [
+            {"ts": bucket, "count": count, "min": low, "max": high, "avg": total / count}
+            for bucket, count, total, low, high in cursor.fetchall()
+        ]
+
+    async def query(self, metric: str, start: float, end: float, step: Optional[float] = None) -> Dict[str, Any]:
+        """Return the points of a metric between start and end at the cheapest fitting resolution."""
+        await self.flush()
+        resolution = self.pick_resolution(start, end, step)
+        # Buckets can not be finer than the resolution they are built from
+        wanted = step if step else math.ceil((end - start) / MAX_POINTS)
+        bucket_step = max(int(wanted), resolution, 1)
+        points = await self._run(self._query, metric, start, end, resolution, bucket_step)
+        return {"metric": metric, "resolution": resolution, "step": bucket_step, "points": points}
+
+    async def metrics(self) -> List[str]:
+        """Return all metric names in the store."""
+        await self.flush()
+        rows = await self._run(lambda: self._conn.execute("SELECT DISTINCT metric FROM history WHERE step = ?", (RESOLUTIONS[-1],)).fetchall())
+        return [row[0] for row in rows]
+
+
+# Global instance of HistoryStore
+history = HistoryStore(config.history_db, config.history_retention, float(config.history_flush_interval))
@@ -0,0 +1,52 @@
+#!/usr/bin/python3
+
+import aiohttp
+from typing import Optional
+from config import config
+from services.logger import logger
+
+
+class HttpClient:
+    """
+    Holds the single aiohttp session used for all outbound calls, so
+    connections, DNS lookups and TLS sessions are reused between checks.
+    """
+
+    def __init__(self) -> None:
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def start(self) -> None:
+        """Create the pooled session, called when the app starts."""
+        if self._session is not None and not self._session.closed:
+            return
+
+        connector = aiohttp.TCPConnector(
+            limit=int(config.http_pool_size),
+            limit_per_host=int(config.http_pool_per_host),
+            ttl_dns_cache=int(config.http_dns_cache_ttl),
+            use_dns_cache=True
+        )
+        timeout = aiohttp.ClientTimeout(
+            total=None,
+            connect=float(config.http_connect_timeout),
+            sock_read=float(config.http_read_timeout)
+        )
+        self._session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        logger.info(f"HTTP client started (pool size: {config.http_pool_size}, per host: {config.http_pool_per_host})")
+
+    async def close(self) -> None:
+        """Close the session and its pooled connections, called when the app stops."""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+            logger.info("HTTP client closed")
+        self._session = None
+
+    async def session(self) -> aiohttp.ClientSession:
+        """Return the shared session, creating it when used outside the app lifespan."""
+        if self._session is None or self._session.closed:
+            await self.start()
+        return self._session
+
+
+# Global instance of HttpClient
+http_client = HttpClient()
@@ -2,10 +2,48 @@
 
 import os
 import time
+import queue
+import atexit
+import random
 import colorlog
 import logging
 import logging.config
-from typing import Optional
+import logging.handlers
+from typing import Dict, Optional
+
+
+class AccessLogSampler(logging.Filter):
+    """
+    Thins out access log lines per level: sample keeps that fraction of the
+    lines, rate caps the lines written per second. Levels not configured are
+    always kept.
+    """
+
+    def __init__(self, sample: Dict[str, float], rate: Dict[str, float]) -> None:
+        super().__init__()
+        self.sample = {level.upper(): fraction for level, fraction in sample.items()}
+        self.rate = {level.upper(): limit for level, limit in rate.items()}
+        # Level -> (second, lines written in that second)
+        self._windows: Dict[str, tuple] = {}
+        self.dropped = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        fraction = self.sample.get(record.levelname, 1.0)
+        if fraction < 1.0 and random.random() >= fraction:
+            self.dropped += 1
+            return False
+
+        limit = self.rate.get(record.levelname)
+        if limit:
+            second = int(record.created)
+            window, count = self._windows.get(record.levelname, (second, 0))
+            if window != second:
+                window, count = second, 0
+            if count >= limit:
+                self.dropped += 1
+                return False
+            self._windows[record.levelname] = (window, count + 1)
+        return True
 
 
 class Logger:
@@ -25,6 +63,7 @@ class Logger:
 
         # Set log vars
         LOG_LEVEL = config.log_level.upper()
+        FILE_FORMATTER = "json" if config.log_format == "json" else "default"
         LOG_DIR = config.log_dir
         LOG_FILENAME = f"{config.log_filename}-{time.strftime('%m-%d-%Y')}.log"
 
@@ -32,6 +71,13 @@ class Logger:
         if not os.path.exists(LOG_DIR):
             os.makedirs(LOG_DIR)
 
+        # Size based rotation is not safe across processes, with several workers every process
+        # appends to the same file and logrotate rotates it
+        if int(config.workers) > 1:
+            info_file_handler = {"class": "logging.handlers.WatchedFileHandler"}
+        else:
+            info_file_handler = {"class": "logging.handlers.RotatingFileHandler", "maxBytes": 10485760, "backupCount": 31}
+
         # Choose handlers based on LOG_LEVEL
         active_handlers = ["console"]
         if LOG_LEVEL == "DEBUG":
@@ -60,6 +106,10 @@ class Logger:
                 "extended": {
                     "format": "[%(asctime)s] [%(levelname)s] [%(name)s] - %(message)s - [%(pathname)s - %(module)s - %(funcName)s - %(lineno)d]",
                 },
+                "json": {
+                    "()": "pythonjsonlogger.json.JsonFormatter",
+                    "format": "%(asctime)s %(levelname)s %(name)s %(message)s %(module)s %(funcName)s %(lineno)d",
+                },
             },
             "handlers": {
                 "console": {
@@ -69,18 +119,16 @@ class Logger:
                 },
                 "debug_file": {
                     "level": "DEBUG",
-                    "formatter": "extended",
+                    "formatter": "json" if FILE_FORMATTER == "json" else "extended",
                     "class": "logging.FileHandler",
                     "filename": os.path.join(LOG_DIR, ("debug-" + LOG_FILENAME)),
                     "mode": "a",
                 },
                 "info_rotating_file": {
                     "level": "INFO",
-                    "formatter": "default",
-                    "class": "logging.handlers.RotatingFileHandler",
+                    "formatter": FILE_FORMATTER,
                     "filename": os.path.join(LOG_DIR, LOG_FILENAME),
-                    "maxBytes": 10485760,
-                    "backupCount": 31,
+                    **info_file_handler,
                 },
             },
             "root": {
@@ -90,12 +138,40 @@ class Logger:
         }
 
         logging.config.dictConfig(LOGGING_CONFIG)
+
+        # Hand records to a queue and let a background thread format and write them,
+        # so request handlers never wait for the console or the log file
+        root = logging.getLogger()
+        handlers = list(root.handlers)
+        for handler in handlers:
+            root.removeHandler(handler)
+        log_queue: queue.SimpleQueue = queue.SimpleQueue()
+        root.addHandler(logging.handlers.QueueHandler(log_queue))
+        self.listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+        self.listener.start()
+        atexit.register(self.stop)
+
         self.logger = logging.getLogger("monitoring_api")
         self.logger.setLevel(getattr(logging, LOG_LEVEL, logging.INFO))
 
+        # One line per request, thinned out by the access log sampler
+        self.access_logger = logging.getLogger("monitoring_api.access")
+        self.access_sampler = AccessLogSampler(config.access_log_sample, config.access_log_rate)
+        self.access_logger.addFilter(self.access_sampler)
+
+    def stop(self) -> None:
+        """Write out the queued records and stop the writer thread."""
+        if self.listener._thread is not None:
+            self.listener.stop()
+
     def get_logger(self):
         """Returns the configured logger instance."""
         return self.logger
 
+    def get_access_logger(self):
+        """Returns the sampled access logger instance."""
+        return self.access_logger
+
 
 logger = Logger().get_logger()
+access_logger = Logger().get_access_logger()
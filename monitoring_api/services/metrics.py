@@ -0,0 +1,139 @@
+#!/usr/bin/python3
+
+from typing import Dict, List, Optional, Tuple, Union
+from services.collector import Collector, collector
+from services.logger import logger
+
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+MB = 1024 ** 2
+GB = 1024 ** 3
+
+
+def _escape(value: str) -> str:
+    """Escape a label value."""
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(labels: Dict[str, str]) -> str:
+    """Format a label set, empty when there are no labels."""
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in labels.items()) + "}"
+
+
+class MetricFamily:
+    """One metric with its metadata and samples in the OpenMetrics text format."""
+
+    def __init__(self, name: str, kind: str, help_text: str, unit: Optional[str] = None) -> None:
+        self.name = name
+        self.kind = kind
+        self.help_text = help_text
+        self.unit = unit
+        self.samples: List[Tuple[Dict[str, str], Union[int, float]]] = []
+
+    def add(self, value: Union[int, float], **labels: str) -> None:
+        """Add a sample with the given labels."""
+        self.samples.append((labels, value))
+
+    def render(self) -> List[str]:
+        """Return the lines of this metric, nothing when it has no samples."""
+        if not self.samples:
+            return []
+        lines = [f"# TYPE {self.name} {self.kind}", f"# HELP {self.name} {self.help_text}"]
+        if self.unit:
+            lines.append(f"# UNIT {self.name} {self.unit}")
+        # Info metrics get the _info suffix on their samples
+        sample_name = f"{self.name}_info" if self.kind == "info" else self.name
+        for labels, value in self.samples:
+            lines.append(f"{sample_name}{_labels(labels)} {value}")
+        return lines
+
+
+class MetricsExporter:
+    """
+    Renders the collector snapshot as OpenMetrics text. The text is kept and
+    only rebuilt when the snapshot version changes, so a scrape of an
+    unchanged snapshot just returns the cached body.
+    """
+
+    def __init__(self, source: Collector) -> None:
+        self.source = source
+        self._version = -1
+        self._body = b""
+
+    def render(self) -> bytes:
+        """Return the metrics text of the current snapshot."""
+        if self.source.version != self._version:
+            version = self.source.version
+            self._body = self._build().encode("utf-8")
+            self._version = version
+            logger.debug(f"Rebuilt metrics for snapshot version {version} ({len(self._body)} bytes)")
+        return self._body
+
+    def _build(self) -> str:
+        """Build the metrics text from the latest samples."""
+        up = MetricFamily("server_monitor_check_up", "gauge", "Whether the latest sample of a check succeeded")
+        sampled = MetricFamily("server_monitor_check_sampled_timestamp_seconds", "gauge", "Unix time of the latest sample of a check", "seconds")
+        duration = MetricFamily("server_monitor_check_duration_seconds", "gauge", "Time the latest sample of a check took", "seconds")
+        public_ip = MetricFamily("server_monitor_public_ip", "info", "Public IP address of the server")
+        disk_ratio = MetricFamily("server_monitor_disk_free_ratio", "gauge", "Free fraction of a monitored disk", "ratio")
+        disk_bytes = MetricFamily("server_monitor_disk_free_bytes", "gauge", "Free space of a monitored disk", "bytes")
+        disk_inodes = MetricFamily("server_monitor_disk_free_inodes_ratio", "gauge", "Free fraction of the inodes of a monitored disk", "ratio")
+        apt = MetricFamily("server_monitor_apt_updates", "gauge", "Upgradable packages by kind")
+        load = MetricFamily("server_monitor_load_average", "gauge", "System load average by period")
+        memory = MetricFamily("server_monitor_memory_bytes", "gauge", "RAM and swap usage", "bytes")
+        users = MetricFamily("server_monitor_logged_in_users", "gauge", "Number of logged in users")
+        process = MetricFamily("server_monitor_process_up", "gauge", "Whether a monitored process is running")
+
+        for name, sample in sorted(self.source.samples.items()):
+            value = sample.value
+            up.add(int(value.error is None), check=name)
+            if sample.sampled_at is not None:
+                sampled.add(round(sample.sampled_at, 3), check=name)
+            if sample.collect_ms is not None:
+                duration.add(round(sample.collect_ms / 1000, 6), check=name)
+            # Failed checks carry placeholder values, only their up metric is exported
+            if value.error is not None:
+                continue
+
+            if name == "ip":
+                public_ip.add(1, ip=value.ip)
+            elif name == "disk":
+                for mount, usage in value.disks.items():
+                    # Older versions stored just the free percentage
+                    if isinstance(usage, (int, float)):
+                        disk_ratio.add(round(usage / 100, 6), mount=mount)
+                    else:
+                        disk_ratio.add(round(usage.free_percent / 100, 6), mount=mount)
+                        disk_bytes.add(usage.free_bytes if usage.free_bytes is not None else round(usage.free_gb * GB), mount=mount)
+                        if usage.inodes_free_percent is not None:
+                            disk_inodes.add(round(usage.inodes_free_percent / 100, 6), mount=mount)
+            elif name == "apt":
+                apt.add(value.total_updates, kind="total")
+                apt.add(value.critical_updates, kind="security")
+                apt.add(value.held_updates, kind="held")
+            elif name == "load":
+                load.add(value.load_1m, period="1m")
+                load.add(value.load_5m, period="5m")
+                load.add(value.load_15m, period="15m")
+            elif name == "memory":
+                memory.add(round(value.used_ram * MB), type="ram", state="used")
+                memory.add(round(value.total_ram * MB), type="ram", state="total")
+                memory.add(round(value.used_swap * MB), type="swap", state="used")
+                memory.add(round(value.total_swap * MB), type="swap", state="total")
+            elif name == "users":
+                users.add(value.user_count)
+            elif name == "processes":
+                for pattern, running in value.processes.items():
+                    process.add(int(running), process=pattern)
+
+        lines = []
+        for family in (up, sampled, duration, public_ip, disk_ratio, disk_bytes, disk_inodes, apt, load, memory, users, process):
+            lines.extend(family.render())
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+
+# Global instance of MetricsExporter
+metrics_exporter = MetricsExporter(collector)
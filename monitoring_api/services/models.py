@@ -1,59 +1,126 @@
 #!/usr/bin/python3
 
 from pydantic import BaseModel
-from typing import Dict, List, Any, Union
+from typing import Dict, List, Any, Optional, Union
 
 
-class IPStatus(BaseModel):
+class CheckStatus(BaseModel):
+    # Filled in by the collector: unix time the value was sampled and how long the check took.
+    sampled_at: Optional[float] = None
+    collect_ms: Optional[float] = None
+    # Set when the check missed its deadline or failed, the values are then stale or placeholders
+    timed_out: bool = False
+    error: Optional[str] = None
+
+
+class IPStatus(CheckStatus):
     ip: str
 
 
 class DiskUsage(BaseModel):
     free_percent: float
     free_gb: float
+    # Not set in samples taken by older versions
+    free_bytes: Optional[int] = None
+    inodes_free: Optional[int] = None
+    inodes_free_percent: Optional[float] = None
+    fstype: Optional[str] = None
 
 
-class DiskSpaceStatus(BaseModel):
+class DiskSpaceStatus(CheckStatus):
     # Backwards compatible: older versions returned just a float percentage.
     disks: Dict[str, Union[float, DiskUsage]]
 
 
-class AptUpdateStatus(BaseModel):
+class AptUpdateStatus(CheckStatus):
     total_updates: int
     critical_updates: int
+    held_updates: int = 0
 
 
-class LoadStatus(BaseModel):
+class LoadStatus(CheckStatus):
     load_1m: float
     load_5m: float
     load_15m: float
 
 
-class MemoryStatus(BaseModel):
+class MemoryStatus(CheckStatus):
     used_ram: float
     total_ram: float
     used_swap: float
     total_swap: float
 
 
-class LoggedInUsersStatus(BaseModel):
+class LoggedInUsersStatus(CheckStatus):
     user_count: int
     usernames: List[str]
 
 
-class ProcessStatus(BaseModel):
+class ProcessStatus(CheckStatus):
     processes: Dict[str, bool]
 
 
-class PlexStatus(BaseModel):
-    plex: Dict[str, Any]
-
-
-class MonitoringStatus(BaseModel):
-    public_ip: IPStatus
-    disk_space: DiskSpaceStatus
-    apt_updates: AptUpdateStatus
-    load_status: LoadStatus
-    memory_status: MemoryStatus
-    logged_in_user_status: LoggedInUsersStatus
-    process_status: ProcessStatus
+class PlexSession(BaseModel):
+    session_key: Optional[str] = None
+    username: Optional[str] = None
+    friendly_name: Optional[str] = None
+    full_title: Optional[str] = None
+    library_name: Optional[str] = None
+    media_type: Optional[str] = None
+    parent_media_index: Optional[int] = None
+    media_index: Optional[int] = None
+    progress_percent: Optional[int] = None
+    platform: Optional[str] = None
+    device: Optional[str] = None
+    ip_address_public: Optional[str] = None
+    bandwidth: Optional[int] = None
+    quality_profile: Optional[str] = None
+    video_full_resolution: Optional[str] = None
+    state: Optional[str] = None
+
+
+class PlexStatus(CheckStatus):
+    stream_count: int = 0
+    total_bandwidth: int = 0
+    sessions: List[PlexSession] = []
+    # The untrimmed Tautulli get_activity response, only returned with ?raw=true
+    plex: Optional[Dict[str, Any]] = None
+
+
+class MonitoringStatus(CheckStatus):
+    # Sections of checks that were not selected with ?checks= are None
+    public_ip: Optional[IPStatus] = None
+    disk_space: Optional[DiskSpaceStatus] = None
+    apt_updates: Optional[AptUpdateStatus] = None
+    load_status: Optional[LoadStatus] = None
+    memory_status: Optional[MemoryStatus] = None
+    logged_in_user_status: Optional[LoggedInUsersStatus] = None
+    process_status: Optional[ProcessStatus] = None
+
+
+# Section of MonitoringStatus per check
+STATUS_SECTIONS = {
+    "ip": "public_ip",
+    "disk": "disk_space",
+    "apt": "apt_updates",
+    "load": "load_status",
+    "memory": "memory_status",
+    "users": "logged_in_user_status",
+    "processes": "process_status",
+}
+
+
+class HistoryPoint(BaseModel):
+    ts: float
+    count: int
+    min: float
+    max: float
+    avg: float
+
+
+class HistoryResponse(BaseModel):
+    metric: str
+    # Stored resolution the points were read from (0 is raw) and the bucket size of the points
+    resolution: int
+    step: int
+    points: List[HistoryPoint]
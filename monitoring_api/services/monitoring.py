@@ -1,12 +1,21 @@
 #!/usr/bin/python3
 
 import os
+import time
 import psutil
-import aiohttp
-import subprocess
+import asyncio
+import functools
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
 from config import config
 from services.logger import logger
+from services.executor import probe_executor
+from services.http_client import http_client
+from services.apt import apt_engine
+from services.disks import disk_engine
+from services.processes import ProcessIndex, ProcessMatcher
+from services.timings import timings
 from services.models import (
+    CheckStatus,
     IPStatus,
     DiskSpaceStatus,
     AptUpdateStatus,
@@ -14,71 +23,152 @@ from services.models import (
     MemoryStatus,
     LoggedInUsersStatus,
     ProcessStatus,
+    PlexSession,
     PlexStatus
 )
 
 
+# Used when a check has no TTL configured
+DEFAULT_TTL = 5.0
+
+
+class CoalescingCache:
+    """
+    Single-flight cache for one check. Concurrent callers share one in-flight
+    execution, and once the TTL expires callers get the last good value right
+    away while a refresh runs in the background (stale-while-revalidate).
+    """
+
+    def __init__(self, name: str, func: Callable[[], Awaitable[CheckStatus]], ttl: float) -> None:
+        self.name = name
+        self.func = func
+        self.ttl = ttl
+        self.value: Optional[CheckStatus] = None
+        self.fetched_at = 0.0
+        # Called with every value stored in the cache, used by the collector
+        self.on_update: Optional[Callable[[CheckStatus], None]] = None
+        self._inflight: Optional[asyncio.Task] = None
+
+    def age(self) -> float:
+        """Seconds since the cached value was fetched."""
+        return time.monotonic() - self.fetched_at
+
+    def remaining(self) -> int:
+        """Seconds until the cached value is refreshed."""
+        return max(0, int(self.ttl - self.age()))
+
+    async def get(self, max_age: Optional[float] = None) -> CheckStatus:
+        """
+        Return the cached value. A value older than the TTL is returned as is
+        while a background refresh starts, a value older than max_age is not
+        served and the caller waits for the refresh instead.
+        """
+        if self.value is None or (max_age is not None and self.age() > max_age):
+            return await self.refresh()
+
+        if self.age() > self.ttl:
+            self._start()
+        return self.value
+
+    async def refresh(self) -> CheckStatus:
+        """Run the check now, or join the execution that is already in flight."""
+        # Shield so a caller that gives up does not cancel the shared execution
+        return await asyncio.shield(self._start())
+
+    def _start(self) -> asyncio.Task:
+        """Start an execution unless one is in flight, and return it."""
+        if self._inflight is None:
+            self._inflight = asyncio.create_task(self._execute(), name=f"check-{self.name}")
+        return self._inflight
+
+    async def _execute(self) -> CheckStatus:
+        """Run the check, stamp the result and store it when it is usable."""
+        try:
+            start = time.perf_counter()
+            sampled_at = time.time()
+            value = await self.func()
+            value.sampled_at = sampled_at
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            value.collect_ms = round(elapsed_ms, 3)
+            timings.record(f"check.{self.name}", elapsed_ms, value.error is not None)
+
+            # Keep serving the last good value when the check failed
+            if value.error is None or self.value is None:
+                self.value = value
+                self.fetched_at = time.monotonic()
+                if self.on_update:
+                    self.on_update(value)
+            else:
+                logger.warning(f"Check {self.name} failed, keeping the value from {self.age():.0f} seconds ago")
+            return value
+        finally:
+            self._inflight = None
+
+
+def coalesced(name: str) -> Callable:
+    """
+    Decorator wrapping a check in a CoalescingCache with the TTL configured for it.
+    The cache is available on the wrapped function as `.cache`.
+    """
+    def decorator(func: Callable[[], Awaitable[CheckStatus]]) -> Callable[[], Awaitable[CheckStatus]]:
+        cache = CoalescingCache(name, func, float(config.check_ttls.get(name, DEFAULT_TTL)))
+
+        @functools.wraps(func)
+        async def wrapper() -> CheckStatus:
+            return await cache.get()
+
+        wrapper.cache = cache
+        return wrapper
+    return decorator
+
+
+@coalesced("ip")
 async def check_ip() -> IPStatus:
     """Return the value of the current public IP."""
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get("https://api4.ipify.org?format=json") as response:
-                if not response.ok:
-                    logger.error(f"Not OK response for IPv4 GET. Error: {response.status_code} - {response.reason} - {response.text}")
-                    return IPStatus(ip="-1")
-                logger.info(f"IP Check response: {response.text}")
-                ip_response = await response.json()
-                ip = ip_response.get("ip")
-                return IPStatus(ip=str(ip))
+        session = await http_client.session()
+        async with session.get(config.ip_check_url) as response:
+            if not response.ok:
+                logger.error(f"Not OK response for IPv4 GET. Error: {response.status} - {response.reason}")
+                return IPStatus(ip="-1", error=f"HTTP {response.status} - {response.reason}")
+            ip_response = await response.json()
+            ip = ip_response.get("ip")
+            logger.info(f"IP Check response: {ip}")
+            return IPStatus(ip=str(ip))
 
     except Exception as e:
         logger.error(f"Failed to check IP: {e}")
-        return IPStatus(ip="-1")
+        return IPStatus(ip="-1", error=str(e))
 
 
+@coalesced("disk")
 async def check_disk() -> DiskSpaceStatus:
-    """Return monitored disks with free percent and free space in GB."""
-    disk_info = {}
-
+    """Return the tracked mounts with free space and inodes."""
     try:
-        for disk in config.monitored_disks:
-            disk = disk.strip()
-            if not os.path.ismount(disk):
-                logger.warning(f"Skipping non-existent or unmounted disk: {disk}")
-                continue
-
-            usage = psutil.disk_usage(disk)
-            free_percentage = 100 - usage.percent
-            free_gb = usage.free / (1024 ** 3)
-            disk_info[disk] = {"free_percent": free_percentage, "free_gb": free_gb}
-
+        # Reads mountinfo (parsed again only when it changed) and statvfs once per filesystem
+        disk_info = await probe_executor.run("disk", disk_engine.usage)
         return DiskSpaceStatus(disks=disk_info)
 
     except Exception as e:
         logger.error(f"Failed to check disks: {e}")
-        return DiskSpaceStatus(disks={"error": {"free_percent": -1, "free_gb": -1}})
+        return DiskSpaceStatus(disks={"error": {"free_percent": -1, "free_gb": -1}}, error=str(e))
 
 
+@coalesced("apt")
 async def check_apt_updates() -> AptUpdateStatus:
-    """Check for available APT package updates and count critical security updates."""
+    """Check for available APT package updates and count security and held updates."""
     try:
-        # Run command to check for upgradable packages
-        result = subprocess.run(
-            ["apt", "list", "--upgradable"], capture_output=True, text=True)
-
-        # Skip first line (header)
-        lines = result.stdout.strip().split("\n")[1:]
-        total_updates = len(lines)
-        critical_updates = sum(
-            1 for line in lines if "security" in line.lower())
-        logger.info(f"APT Updates: {total_updates} total, {critical_updates} critical")
-        return AptUpdateStatus(total_updates=total_updates, critical_updates=critical_updates)
+        # Reads the dpkg status and apt lists, cached until those files change
+        counts = await probe_executor.run("apt", apt_engine.count)
+        logger.info(f"APT Updates: {counts.total} total, {counts.security} critical, {counts.held} held")
+        return AptUpdateStatus(total_updates=counts.total, critical_updates=counts.security, held_updates=counts.held)
 
     except Exception as e:
         logger.error(f"Failed to check APT updates: {e}")
-        return AptUpdateStatus(total_updates=-1, critical_updates=-1)
+        return AptUpdateStatus(total_updates=-1, critical_updates=-1, held_updates=-1, error=str(e))
 
 
+@coalesced("load")
 async def check_load() -> LoadStatus:
     """Check system load averages for the past 1, 5, and 15 minutes."""
     try:
@@ -88,14 +178,19 @@ async def check_load() -> LoadStatus:
 
     except Exception as e:
         logger.error(f"Failed to check system load: {e}")
-        return LoadStatus(load_1m=-1, load_5m=-1, load_15m=-1)
+        return LoadStatus(load_1m=-1, load_5m=-1, load_15m=-1, error=str(e))
+
+
+def _probe_memory() -> Tuple[Any, Any]:
+    """Blocking part of the memory check, runs in the probe executor."""
+    return psutil.virtual_memory(), psutil.swap_memory()
 
 
+@coalesced("memory")
 async def check_memory() -> MemoryStatus:
     """Check used RAM and total RAM, plus available/total swap."""
     try:
-        ram = psutil.virtual_memory()
-        swap = psutil.swap_memory()
+        ram, swap = await probe_executor.run("memory", _probe_memory)
 
         # Calculate ram/swap in MB
         used_ram = ram.used / (1024 ** 2)
@@ -113,13 +208,14 @@ async def check_memory() -> MemoryStatus:
 
     except Exception as e:
         logger.error(f"Failed to check memory: {e}")
-        return MemoryStatus(used_ram=-1, total_ram=-1, used_swap=-1, total_swap=-1)
+        return MemoryStatus(used_ram=-1, total_ram=-1, used_swap=-1, total_swap=-1, error=str(e))
 
 
+@coalesced("users")
 async def check_logged_in_users() -> LoggedInUsersStatus:
     """Check the number of users currently logged into the system."""
     try:
-        users = psutil.users()
+        users = await probe_executor.run("users", psutil.users)
         usernames = list(set(user.name for user in users))
         user_count = len(usernames)
 
@@ -128,30 +224,71 @@ async def check_logged_in_users() -> LoggedInUsersStatus:
 
     except Exception as e:
         logger.error(f"Failed to check logged-in users: {e}")
-        return LoggedInUsersStatus(user_count=-1, usernames=[])
+        return LoggedInUsersStatus(user_count=-1, usernames=[], error=str(e))
 
 
+# Persistent process index and the matcher for the monitored process list
+process_index = ProcessIndex()
+process_matcher = ProcessMatcher(config.monitored_processes)
+
+
+def _probe_processes() -> Dict[str, bool]:
+    """Blocking part of the process check, runs in the probe executor."""
+    return process_matcher.match(process_index.refresh())
+
+
+@coalesced("processes")
 async def check_processes() -> ProcessStatus:
     """Check if the specified processes from ENV are running."""
-    process_status = {
-        proc.strip(): False for proc in config.monitored_processes if proc.strip()}
-
     try:
-        running_processes = {p.info["name"].lower()
-                             for p in psutil.process_iter(attrs=["name"])}
-
-        for proc in process_status.keys():
-            if proc.lower() in running_processes:
-                process_status[proc] = True
+        process_status = await probe_executor.run("processes", _probe_processes)
 
         logger.info(f"Process Check: {process_status}")
         return ProcessStatus(processes=process_status)
 
     except Exception as e:
         logger.error(f"Failed to check processes: {e}")
-        return ProcessStatus(processes={"error": False})
+        return ProcessStatus(processes={"error": False}, error=str(e))
+
+
+def _as_int(value: Any) -> Optional[int]:
+    """Tautulli sends numbers as strings and empty strings for missing ones."""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def trim_session(session: Dict[str, Any]) -> Dict[str, Any]:
+    """Keep the PlexSession fields of a Tautulli session, converted to their types. Empty values are left out."""
+    trimmed = {}
+    for name, field in PlexSession.model_fields.items():
+        value = session.get(name)
+        if value is None or value == "":
+            continue
+        trimmed[name] = _as_int(value) if field.annotation == Optional[int] else str(value)
+    return trimmed
+
+
+def parse_activity(data: Dict[str, Any]) -> PlexStatus:
+    """Trim a Tautulli get_activity response to the typed session list, the raw response is kept aside."""
+    response = data.get("response") or {}
+    if response.get("result") != "success":
+        return PlexStatus(error=f"Tautulli: {response.get('message') or 'get_activity failed'}", plex=data)
+
+    activity = response.get("data") or {}
+    sessions = [PlexSession.model_construct(**trim_session(session)) for session in activity.get("sessions") or []]
+
+    # The sessions are built from checked values, only the raw response is not validated at all
+    return PlexStatus.model_construct(
+        stream_count=_as_int(activity.get("stream_count")) or 0,
+        total_bandwidth=_as_int(activity.get("total_bandwidth")) or 0,
+        sessions=sessions,
+        plex=data
+    )
 
 
+@coalesced("plex")
 async def check_plex() -> PlexStatus:
     """Check the current streaming status of Plex"""
     url = f"{config.tautulli_url}/api/v2"
@@ -162,11 +299,16 @@ async def check_plex() -> PlexStatus:
     }
 
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, params=params) as response:
-                data = await response.json()
-                return PlexStatus(plex=data)
+        session = await http_client.session()
+        async with session.get(url, params=params) as response:
+            if not response.ok:
+                logger.error(f"Not OK response from Tautulli. Error: {response.status} - {response.reason}")
+                return PlexStatus(error=f"HTTP {response.status} - {response.reason}")
+            data = await response.json()
+            if not isinstance(data, dict):
+                return PlexStatus(error="Tautulli returned an unexpected response")
+            return parse_activity(data)
 
     except Exception as e:
         logger.error(f"Failed to check Plex: {e}")
-        return PlexStatus(plex={"error": False})
+        return PlexStatus(error=str(e))
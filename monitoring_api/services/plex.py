@@ -0,0 +1,139 @@
+#!/usr/bin/python3
+
+import time
+import asyncio
+from typing import Any, Dict, Optional
+from config import config
+from services.logger import logger
+from services.models import PlexSession, PlexStatus
+from services.monitoring import check_plex, trim_session
+
+# Session state set by the Tautulli actions that change it
+ACTION_STATES = {"play": "playing", "resume": "playing", "pause": "paused", "buffer": "buffering"}
+
+# Actions that add or update a session, stop removes it
+UPDATE_ACTIONS = {"play", "resume", "pause", "buffer", "transcode", "watched", "update"}
+
+
+class PlexSessionTable:
+    """
+    Live Plex sessions pushed by Tautulli webhooks, so the Plex status is
+    served without asking Tautulli. Events only carry the fields of the
+    webhook template, they are merged into the known session. Every
+    TAUTULLI_RECONCILE_INTERVAL the table is replaced by Tautulli's own
+    get_activity to repair missed events.
+    """
+
+    def __init__(self) -> None:
+        self.sessions: Dict[str, PlexSession] = {}
+        self.enabled = False
+        self.updated_at: Optional[float] = None
+        self.interval = float(config.tautulli_reconcile_interval)
+        self.events: Dict[str, int] = {}
+        # Time of the last event per session, events newer than a reconciliation win over it
+        self.touched: Dict[str, float] = {}
+        self.repaired = 0
+        # Microseconds of the last change of the table, used as ETag of the Plex status
+        self.version = 0
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        """Start reconciling when a webhook secret is configured."""
+        if not config.tautulli_webhook_secret:
+            return
+        if int(config.workers) > 1:
+            logger.warning("Tautulli webhooks need a single worker, Plex status keeps polling Tautulli")
+            return
+        self.enabled = True
+        self._task = asyncio.create_task(self._run(), name="plex-reconcile")
+        logger.info(f"Plex session table started (reconcile interval: {self.interval:.0f} seconds)")
+
+    async def stop(self) -> None:
+        """Stop reconciling."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.enabled = False
+
+    async def _run(self) -> None:
+        """Reconcile right away, then every interval."""
+        while True:
+            try:
+                await self.reconcile()
+            except Exception as e:
+                logger.error(f"Plex session reconciliation failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    def apply(self, event: Dict[str, Any]) -> str:
+        """Apply one webhook event and return its action, raises ValueError for events that can not be applied."""
+        action = str(event.get("action") or "").lower()
+        key = str(event.get("session_key") or "")
+        if not key:
+            raise ValueError("Event has no session_key")
+
+        if action == "stop":
+            self.sessions.pop(key, None)
+        elif action in UPDATE_ACTIONS:
+            fields = trim_session(event)
+            if action in ACTION_STATES:
+                fields["state"] = ACTION_STATES[action]
+            current = self.sessions.get(key)
+            self.sessions[key] = current.model_copy(update=fields) if current else PlexSession.model_construct(**fields)
+        else:
+            raise ValueError(f"Unknown action: {action}")
+
+        self.events[action] = self.events.get(action, 0) + 1
+        self._bump()
+        self.updated_at = self.touched[key] = time.time()
+        logger.debug(f"Plex webhook {action} for session {key}, {len(self.sessions)} active")
+        return action
+
+    async def reconcile(self) -> None:
+        """Replace the table with the sessions Tautulli reports, counting the sessions that differed."""
+        started = time.time()
+        status = await check_plex.cache.refresh()
+        if status.error is not None:
+            logger.warning(f"Skipping Plex session reconciliation: {status.error}")
+            return
+
+        sessions = {session.session_key: session for session in status.sessions if session.session_key}
+
+        # Events that arrived while get_activity was running are newer than its answer
+        self.touched = {key: at for key, at in self.touched.items() if at >= started}
+        for key in self.touched:
+            if key in self.sessions:
+                sessions[key] = self.sessions[key]
+            else:
+                sessions.pop(key, None)
+
+        repaired = len(self.sessions.keys() ^ sessions.keys()) + sum(
+            1 for key, session in sessions.items() if key in self.sessions and self.sessions[key].state != session.state)
+        if repaired:
+            logger.info(f"Reconciliation repaired {repaired} Plex sessions")
+        self.repaired += repaired
+        self.sessions = sessions
+        self._bump()
+        self.updated_at = time.time()
+
+    def _bump(self) -> None:
+        """Move the version on, based on the time so it does not repeat after a restart."""
+        self.version = max(self.version + 1, time.time_ns() // 1000)
+
+    def status(self) -> PlexStatus:
+        """Return the live sessions as a Plex status."""
+        sessions = list(self.sessions.values())
+        return PlexStatus.model_construct(
+            sampled_at=self.updated_at,
+            collect_ms=0.0,
+            stream_count=len(sessions),
+            total_bandwidth=sum(session.bandwidth or 0 for session in sessions),
+            sessions=sessions
+        )
+
+
+# Global instance of PlexSessionTable
+plex_sessions = PlexSessionTable()
@@ -0,0 +1,143 @@
+#!/usr/bin/python3
+
+import os
+import re
+import threading
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+from services.logger import logger
+
+PROC_DIR = "/proc"
+
+# Linux truncates /proc/<pid>/comm to this many characters
+COMM_LENGTH = 15
+
+
+class ProcessIndex:
+    """
+    Persistent pid -> (name, cmdline) index of the running processes. Each
+    refresh diffs the pid listing of /proc and only reads the start time,
+    name and command line of new pids, known pids cost no file reads. Every
+    few refreshes the start times of all known pids are compared to catch
+    pids that were reused in between, and every pid is read again to catch
+    processes that called exec.
+    """
+
+    def __init__(self, proc_dir: str = PROC_DIR, full_rescan_every: int = 60) -> None:
+        self.proc_dir = proc_dir
+        self.full_rescan_every = full_rescan_every
+        self.entries: Dict[int, Tuple[str, str]] = {}
+        # Start time in clock ticks since boot per indexed pid
+        self.starts: Dict[int, int] = {}
+        # Lowercased process names with the number of processes using them
+        self.names: Counter = Counter()
+        self._refreshes = 0
+        self._lock = threading.Lock()
+
+    def _start_time(self, pid: int) -> Optional[int]:
+        """Return the start time of a pid (field 22 of its stat file), None when it is gone."""
+        try:
+            with open(os.path.join(self.proc_dir, str(pid), "stat"), "rb") as file:
+                stat = file.read()
+        except OSError:
+            return None
+        # The name in field 2 may hold spaces and parentheses, the fields after it start at field 3
+        return int(stat[stat.rindex(b")") + 2:].split(b" ", 20)[19])
+
+    def _read(self, pid: int) -> Tuple[str, str]:
+        """Read the name and command line of a pid, raises OSError when it is gone."""
+        base = os.path.join(self.proc_dir, str(pid))
+        with open(os.path.join(base, "comm"), "rb") as file:
+            name = file.read().rstrip(b"\n").decode(errors="replace")
+        with open(os.path.join(base, "cmdline"), "rb") as file:
+            args = file.read().rstrip(b"\0").split(b"\0")
+        cmdline = " ".join(arg.decode(errors="replace") for arg in args)
+
+        # Like psutil, use the full executable name when comm was truncated
+        if len(name) == COMM_LENGTH and args[0]:
+            exe = os.path.basename(args[0].decode(errors="replace"))
+            if exe.startswith(name):
+                name = exe
+        return name.lower(), cmdline
+
+    def _add(self, pid: int, start: int) -> None:
+        """Index a new pid, skipping it when the process already exited."""
+        try:
+            entry = self._read(pid)
+        except OSError:
+            return
+        self.entries[pid] = entry
+        self.starts[pid] = start
+        self.names[entry[0]] += 1
+
+    def _remove(self, pid: int) -> None:
+        """Drop a pid from the index."""
+        del self.starts[pid]
+        name, _ = self.entries.pop(pid)
+        self.names[name] -= 1
+        if self.names[name] <= 0:
+            del self.names[name]
+
+    def refresh(self) -> "ProcessIndex":
+        """Bring the index up to date with the processes currently in /proc."""
+        with self._lock:
+            pids = {int(name) for name in os.listdir(self.proc_dir) if name.isdigit()}
+
+            self._refreshes += 1
+            reused = 0
+            if self._refreshes % self.full_rescan_every == 0:
+                # A known pid with another start time was reused by a new process
+                reused = sum(1 for pid, start in self.starts.items() if pid in pids and self._start_time(pid) not in (start, None))
+                stale = set(self.entries)
+            else:
+                stale = self.entries.keys() - pids
+
+            for pid in stale:
+                self._remove(pid)
+            new = pids - self.entries.keys()
+            for pid in new:
+                # Pids that exited since the listing have no start time and are left out
+                start = self._start_time(pid)
+                if start is not None:
+                    self._add(pid, start)
+
+            logger.debug(f"Process index: {len(self.entries)} processes, {len(new)} new, {len(stale)} removed, {reused} reused")
+            return self
+
+
+class ProcessMatcher:
+    """
+    Precompiled matcher for the monitored process list. Entries are matched as
+    an exact process name, or as a command line substring with the `cmd:`
+    prefix, or as a command line regex with the `re:` prefix.
+    """
+
+    def __init__(self, patterns: List[str]) -> None:
+        # (entry, kind, compiled argument) in configured order
+        self.matchers: List[Tuple[str, str, Any]] = []
+
+        for pattern in (p.strip() for p in patterns):
+            if not pattern:
+                continue
+            if pattern.startswith("cmd:"):
+                self.matchers.append((pattern, "cmd", pattern[4:]))
+            elif pattern.startswith("re:"):
+                self.matchers.append((pattern, "re", re.compile(pattern[3:])))
+            else:
+                self.matchers.append((pattern, "name", pattern.lower()))
+        self.needs_cmdlines = any(kind != "name" for _, kind, _ in self.matchers)
+
+    def match(self, index: ProcessIndex) -> Dict[str, bool]:
+        """Return for every monitored entry whether a matching process is running."""
+        # Kernel threads have no command line, fall back to their name
+        cmdlines = [cmdline or name for name, cmdline in index.entries.values()] if self.needs_cmdlines else []
+
+        status = {}
+        for pattern, kind, arg in self.matchers:
+            if kind == "name":
+                status[pattern] = arg in index.names
+            elif kind == "cmd":
+                status[pattern] = any(arg in cmdline for cmdline in cmdlines)
+            else:
+                status[pattern] = any(arg.search(cmdline) for cmdline in cmdlines)
+        return status
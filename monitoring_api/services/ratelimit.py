@@ -0,0 +1,258 @@
+#!/usr/bin/python3
+
+import os
+import mmap
+import time
+import fcntl
+import struct
+import hashlib
+import tempfile
+import functools
+import threading
+from typing import Any, Callable, Optional, Tuple
+from fastapi import Request
+from config import config
+from services.logger import logger
+
+# File header: magic, layout version, slot count
+HEADER = struct.Struct("<4sII")
+MAGIC = b"SMRL"
+VERSION = 2
+
+# Slot: key hash, expires, pinned until, then four fields whose meaning depends on the limiter
+SLOT = struct.Struct("<Qdddddd")
+
+# Slots per bucket, a key can only live in the bucket its hash points to
+WAYS = 8
+
+
+def default_path() -> str:
+    """Return the default table location, in shared memory when the system has it."""
+    directory = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(directory, f"server-monitor-ratelimit-{config.host_port}")
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a client is over its request rate."""
+
+    def __init__(self, retry_after: float) -> None:
+        super().__init__(f"Retry after {retry_after:.1f} seconds")
+        self.retry_after = retry_after
+
+
+class SharedTable:
+    """
+    Fixed size table of limiter state in a memory mapped file, so every
+    worker process that opens the same path shares it. Keys are hashed to a
+    bucket of WAYS slots, and each bucket has its own byte range lock. When
+    a bucket is full an unpinned slot that expires first is reused, so
+    pinned entries such as active blocks survive a flood of new keys.
+    """
+
+    def __init__(self, path: str, slots: int) -> None:
+        self.path = path
+        self.buckets = max(1, slots // WAYS)
+        self.size = HEADER.size + self.buckets * WAYS * SLOT.size
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        # fcntl locks are per process, the thread lock keeps threads in one process apart
+        self._thread_lock = threading.Lock()
+        self._init_file()
+        self._map = mmap.mmap(self._fd, self.size)
+        logger.debug(f"Rate limit table {path} mapped with {self.buckets * WAYS} slots")
+
+    def _init_file(self) -> None:
+        """Size and initialize a new file, refuse a file written with another layout."""
+        fcntl.lockf(self._fd, fcntl.LOCK_EX, HEADER.size, 0)
+        try:
+            header = os.pread(self._fd, HEADER.size, 0)
+            expected = HEADER.pack(MAGIC, VERSION, self.buckets * WAYS)
+            if not header.strip(b"\0"):
+                os.ftruncate(self._fd, self.size)
+                os.pwrite(self._fd, expected, 0)
+                logger.info(f"Initialized rate limit table {self.path}")
+        finally:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN, HEADER.size, 0)
+
+        # Another process may have the file mapped, resizing it under that process would crash it
+        if header.strip(b"\0") and header != expected:
+            os.close(self._fd)
+            raise RuntimeError(f"Rate limit table {self.path} has another layout (RATE_LIMIT_SLOTS or version differ), "
+                               f"point RATE_LIMIT_FILE elsewhere or remove the file when no other API uses it")
+
+    @staticmethod
+    def hash(key: str) -> int:
+        """Return the non-zero 64 bit hash of a key, zero marks an empty slot."""
+        return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "little") or 1
+
+    def update(self, key: str, func: Callable[[Optional[Tuple[float, ...]], float], Tuple[Optional[Tuple[float, ...]], Any]]) -> Any:
+        """
+        Atomically read-modify-write the state of a key. func gets the current
+        fields (or None) and the time, and returns the new fields, where the
+        first two are the expiry and the time the entry is pinned until,
+        together with the result to pass back.
+        Returning None as fields leaves the table untouched, and an empty
+        tuple removes the key.
+        """
+        key_hash = self.hash(key)
+        bucket = key_hash % self.buckets
+        start = HEADER.size + bucket * WAYS * SLOT.size
+        with self._thread_lock:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, WAYS * SLOT.size, start)
+            try:
+                now = time.time()
+                found, victim, victim_rank = None, start, None
+                for offset in range(start, start + WAYS * SLOT.size, SLOT.size):
+                    slot = SLOT.unpack_from(self._map, offset)
+                    if slot[0] == key_hash:
+                        found = offset
+                        break
+                    # Prefer empty slots, then unpinned ones, then the one that expires first
+                    rank = (False, -1.0) if slot[0] == 0 else (slot[2] > now, slot[1])
+                    if victim_rank is None or rank < victim_rank:
+                        victim, victim_rank = offset, rank
+
+                offset = found if found is not None else victim
+                current = None
+                if found is not None:
+                    slot = SLOT.unpack_from(self._map, offset)
+                    if slot[1] > now:
+                        current = slot[1:]
+                fields, result = func(current, now)
+                if fields == ():
+                    if found is not None:
+                        SLOT.pack_into(self._map, offset, 0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0)
+                elif fields is not None:
+                    SLOT.pack_into(self._map, offset, key_hash, *fields)
+                return result
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, WAYS * SLOT.size, start)
+
+    def delete(self, key: str) -> None:
+        """Forget the state of a key."""
+        self.update(key, lambda current, now: ((), None))
+
+    def close(self) -> None:
+        """Unmap the table, the file stays for the other workers."""
+        self._map.close()
+        os.close(self._fd)
+
+
+class TokenBucket:
+    """Token bucket per key: rate tokens per second with room for a burst of burst requests."""
+
+    def __init__(self, table: SharedTable, rate: float, burst: float) -> None:
+        self.table = table
+        self.rate = rate
+        self.burst = burst
+
+    def hit(self, key: str) -> float:
+        """Take a token for key, returns 0 when allowed or the seconds until a token is available."""
+        def take(current: Optional[Tuple[float, ...]], now: float) -> Tuple[Tuple[float, ...], float]:
+            tokens = self.burst
+            if current is not None:
+                _, _, stored, updated, _, _ = current
+                tokens = min(self.burst, stored + (now - updated) * self.rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / self.rate
+            # The entry is worthless once the bucket has filled up again
+            expires = now + (self.burst - tokens) / self.rate
+            return (expires, 0.0, tokens, now, 0.0, 0.0), wait
+
+        return self.table.update(key, take)
+
+
+class LoginThrottle:
+    """
+    Sliding window count of failed logins per key. A key with limit failures
+    inside one window is blocked for block_seconds.
+    """
+
+    def __init__(self, table: SharedTable, limit: int, window: float, block_seconds: float) -> None:
+        self.table = table
+        self.limit = limit
+        self.window = window
+        self.block_seconds = block_seconds
+
+    def _count(self, current: Optional[Tuple[float, ...]], now: float) -> Tuple[float, float, float, float]:
+        """Return window start, current and previous window counts and block end, rolled forward to now."""
+        if current is None:
+            return now - now % self.window, 0.0, 0.0, 0.0
+        _, _, started, count, previous, blocked_until = current
+        window_start = now - now % self.window
+        if window_start - started >= 2 * self.window:
+            count, previous = 0.0, 0.0
+        elif window_start != started:
+            count, previous = 0.0, count
+        return window_start, count, previous, blocked_until
+
+    def blocked(self, key: str) -> float:
+        """Return the seconds a key is still blocked for, 0 when it is not."""
+        def check(current: Optional[Tuple[float, ...]], now: float) -> Tuple[Tuple[float, ...], float]:
+            return None, max(0.0, current[5] - now) if current else 0.0
+
+        return self.table.update(key, check)
+
+    def fail(self, key: str) -> Tuple[int, float]:
+        """Register a failed login, returns the weighted failure count and the block time left."""
+        def register(current: Optional[Tuple[float, ...]], now: float) -> Tuple[Tuple[float, ...], Tuple[int, float]]:
+            window_start, count, previous, blocked_until = self._count(current, now)
+            count += 1
+            # Weigh the previous window by how much of it still overlaps the sliding window
+            weighted = count + previous * (1 - (now - window_start) / self.window)
+            if weighted >= self.limit and blocked_until <= now:
+                blocked_until = now + self.block_seconds
+            expires = max(blocked_until, window_start + 2 * self.window)
+            # A block is pinned so that a flood of other keys can not evict it
+            return (expires, blocked_until, window_start, count, previous, blocked_until), (int(weighted), max(0.0, blocked_until - now))
+
+        return self.table.update(key, register)
+
+    def reset(self, key: str) -> None:
+        """Clear the failures of a key after a successful login."""
+        self.table.delete(key)
+
+
+def client_ip(request: Request) -> str:
+    """Return the address of the client of a request."""
+    return request.client.host if request.client else "unknown"
+
+
+class RateLimiter:
+    """
+    Per client request limiter for the API routes, shared by all workers. A
+    request is counted against the IP address and, on authenticated routes,
+    against the user as well.
+    """
+
+    def __init__(self, table: SharedTable, per_second: float) -> None:
+        self.bucket = TokenBucket(table, per_second, per_second)
+        self.enabled = True
+
+    def check(self, request: Request, username: Optional[str] = None) -> None:
+        """Count a request, raises RateLimitExceeded when the client is over its rate."""
+        if not self.enabled:
+            return
+        wait = self.bucket.hit(f"ip:{client_ip(request)}")
+        if not wait and username:
+            wait = self.bucket.hit(f"user:{username}")
+        if wait:
+            raise RateLimitExceeded(wait)
+
+    def limit(self, func: Callable) -> Callable:
+        """Decorate a route that takes request (and optionally user) to rate limit it."""
+        @functools.wraps(func)
+        async def wrapper(*args: Any, **kwargs: Any) -> Any:
+            user = kwargs.get("user")
+            self.check(kwargs["request"], user.get("username") if isinstance(user, dict) else None)
+            return await func(*args, **kwargs)
+        return wrapper
+
+
+# Global limiter state shared by all API workers
+rate_table = SharedTable(config.rate_limit_file or default_path(), int(config.rate_limit_slots))
+limiter = RateLimiter(rate_table, float(config.api_rate_limit))
+login_throttle = LoginThrottle(rate_table, int(config.failed_attempt_limit),
+                               int(config.block_time_minutes) * 60, int(config.block_time_minutes) * 60)
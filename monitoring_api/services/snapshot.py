@@ -0,0 +1,125 @@
+#!/usr/bin/python3
+
+import os
+import mmap
+import struct
+import tempfile
+from typing import Dict, List, Optional, Tuple
+from config import config
+from services.logger import logger
+
+# File header: magic, layout version, buffer capacity, check count, then the generation
+HEADER = struct.Struct("<4sIII")
+GENERATION = struct.Struct("<Q")
+GENERATION_OFFSET = HEADER.size
+MAGIC = b"SMSS"
+VERSION = 1
+
+# Refresh requests: per check the oldest sampled_at a worker will accept
+REQUEST = struct.Struct("<d")
+REQUESTS_OFFSET = 64
+
+# Every buffer starts with the length of the payload in it
+LENGTH = struct.Struct("<I")
+
+
+def default_path() -> str:
+    """Return the default snapshot location, in shared memory when the system has it."""
+    directory = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(directory, f"server-monitor-snapshot-{config.host_port}")
+
+
+class SharedSnapshot:
+    """
+    The collector snapshot in a memory mapped file, written by the collector
+    process and read by every API worker. It is double buffered: the writer
+    fills the buffer readers are not using and then bumps the generation,
+    readers pick the buffer from the generation and retry when it moved on
+    while they were reading (a seqlock over two buffers).
+    Neither side ever takes a lock.
+
+    A small request area lets workers ask the collector process for a
+    fresher sample of a check than the one in the snapshot.
+    """
+
+    def __init__(self, path: str, capacity: int, checks: List[str]) -> None:
+        self.path = path
+        self.capacity = capacity
+        self.checks = checks
+        self.buffers_offset = REQUESTS_OFFSET + REQUEST.size * len(checks)
+        self.size = self.buffers_offset + 2 * capacity
+        self._map: Optional[mmap.mmap] = None
+
+    def _buffer(self, generation: int) -> int:
+        """Return the offset of the buffer holding a generation."""
+        return self.buffers_offset + (generation % 2) * self.capacity
+
+    def create(self) -> None:
+        """Create (or reset) the file and map it, done once by the process that starts the collector."""
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            os.ftruncate(fd, self.size)
+            os.pwrite(fd, HEADER.pack(MAGIC, VERSION, self.capacity, len(self.checks)), 0)
+        finally:
+            os.close(fd)
+        logger.info(f"Created shared snapshot {self.path} ({self.size} bytes)")
+
+    def open(self) -> None:
+        """Map an existing snapshot file."""
+        fd = os.open(self.path, os.O_RDWR)
+        try:
+            header = os.pread(fd, HEADER.size, 0)
+            if header != HEADER.pack(MAGIC, VERSION, self.capacity, len(self.checks)):
+                raise RuntimeError(f"Shared snapshot {self.path} has an unexpected layout")
+            self._map = mmap.mmap(fd, self.size)
+        finally:
+            os.close(fd)
+
+    def close(self) -> None:
+        """Unmap the file."""
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+    def generation(self) -> int:
+        """Return the generation of the latest published snapshot, 0 before the first one."""
+        return GENERATION.unpack_from(self._map, GENERATION_OFFSET)[0]
+
+    def publish(self, payload: bytes) -> bool:
+        """Write a new snapshot, returns False when it does not fit the buffer."""
+        if LENGTH.size + len(payload) > self.capacity:
+            logger.error(f"Snapshot of {len(payload)} bytes does not fit the shared buffer of {self.capacity} bytes")
+            return False
+        generation = self.generation() + 1
+        offset = self._buffer(generation)
+        LENGTH.pack_into(self._map, offset, len(payload))
+        self._map[offset + LENGTH.size:offset + LENGTH.size + len(payload)] = payload
+        GENERATION.pack_into(self._map, GENERATION_OFFSET, generation)
+        return True
+
+    def read(self, known: int = 0) -> Optional[Tuple[int, bytes]]:
+        """Return the generation and payload of the latest snapshot, or None when it is still the known one."""
+        while True:
+            generation = self.generation()
+            if generation == known:
+                return None
+            offset = self._buffer(generation)
+            length = LENGTH.unpack_from(self._map, offset)[0]
+            payload = self._map[offset + LENGTH.size:offset + LENGTH.size + min(length, self.capacity - LENGTH.size)]
+            # The writer of the next generation but one fills this buffer before it bumps
+            # the generation, so any change while copying may have torn the payload
+            if self.generation() == generation:
+                return generation, payload
+
+    def request(self, check: str, min_sampled_at: float) -> None:
+        """Ask the collector process for a sample of check taken at or after min_sampled_at."""
+        offset = REQUESTS_OFFSET + REQUEST.size * self.checks.index(check)
+        if REQUEST.unpack_from(self._map, offset)[0] < min_sampled_at:
+            REQUEST.pack_into(self._map, offset, min_sampled_at)
+
+    def requests(self) -> Dict[str, float]:
+        """Return per check the oldest sampled_at a worker asked for."""
+        return {
+            check: REQUEST.unpack_from(self._map, REQUESTS_OFFSET + REQUEST.size * index)[0]
+            for index, check in enumerate(self.checks)
+        }
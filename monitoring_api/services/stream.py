@@ -0,0 +1,111 @@
+#!/usr/bin/python3
+
+import asyncio
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Set, Tuple
+from config import config
+from services.logger import logger
+
+
+def diff(old: Optional[Dict[str, Any]], new: Dict[str, Any]) -> Dict[str, Any]:
+    """Return the fields of new that differ from old, nested dicts are compared per key and removed keys are None."""
+    if old is None:
+        return new
+
+    changes = {}
+    for key, value in new.items():
+        previous = old.get(key)
+        if isinstance(value, dict) and isinstance(previous, dict):
+            nested = diff(previous, value)
+            if nested:
+                changes[key] = nested
+        elif key not in old or previous != value:
+            changes[key] = value
+    for key in old.keys() - new.keys():
+        changes[key] = None
+    return changes
+
+
+class Subscriber:
+    """A stream client with a bounded queue, the oldest events are dropped when it falls behind."""
+
+    def __init__(self, queue_size: int) -> None:
+        self.queue: Deque[Tuple[int, str, Dict[str, Any]]] = deque(maxlen=queue_size)
+        self.dropped = 0
+        self._ready = asyncio.Event()
+
+    def push(self, event: Tuple[int, str, Dict[str, Any]]) -> None:
+        """Queue an event, dropping the oldest one when the queue is full."""
+        if len(self.queue) == self.queue.maxlen:
+            self.dropped += 1
+        self.queue.append(event)
+        self._ready.set()
+
+    async def next(self, timeout: float) -> List[Tuple[int, str, Dict[str, Any]]]:
+        """Wait up to timeout seconds for events and return everything queued."""
+        if not self.queue:
+            self._ready.clear()
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return []
+        events = list(self.queue)
+        self.queue.clear()
+        return events
+
+
+class Broadcaster:
+    """
+    Turns collector samples into numbered delta events and fans them out to
+    every stream subscriber. A backlog of recent events lets clients resume
+    from the last sequence number they saw. With several workers every worker
+    numbers and diffs its own events and a reconnect usually lands on another
+    worker, so a resumed stream always starts with a snapshot there.
+    """
+
+    def __init__(self, queue_size: int, backlog_size: int, resumable: bool = True) -> None:
+        self.queue_size = queue_size
+        self.resumable = resumable
+        self.seq = 0
+        self.state: Dict[str, Dict[str, Any]] = {}
+        self.backlog: Deque[Tuple[int, str, Dict[str, Any]]] = deque(maxlen=backlog_size)
+        self.subscribers: Set[Subscriber] = set()
+
+    def publish(self, name: str, value: Any) -> None:
+        """Publish the fields of a check that changed since its previous sample."""
+        data = value.model_dump(mode="json")
+        changes = diff(self.state.get(name), data)
+        self.state[name] = data
+        if not changes:
+            return
+
+        self.seq += 1
+        event = (self.seq, "delta", {"check": name, "changes": changes})
+        self.backlog.append(event)
+        for subscriber in self.subscribers:
+            subscriber.push(event)
+
+    def subscribe(self, last_seq: Optional[int] = None) -> Subscriber:
+        """
+        Register a subscriber. When last_seq is still in the backlog the missed
+        events are replayed, otherwise the subscriber starts with a full snapshot.
+        """
+        subscriber = Subscriber(self.queue_size)
+        if self.resumable and last_seq is not None and self.backlog and self.backlog[0][0] <= last_seq + 1 and last_seq <= self.seq:
+            for event in self.backlog:
+                if event[0] > last_seq:
+                    subscriber.push(event)
+        else:
+            subscriber.push((self.seq, "snapshot", {"checks": dict(self.state)}))
+        self.subscribers.add(subscriber)
+        logger.info(f"Stream subscriber added ({len(self.subscribers)} connected)")
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        """Remove a subscriber."""
+        self.subscribers.discard(subscriber)
+        logger.info(f"Stream subscriber removed ({len(self.subscribers)} connected, {subscriber.dropped} events dropped)")
+
+
+# Global instance of Broadcaster
+broadcaster = Broadcaster(int(config.stream_queue_size), int(config.stream_backlog), resumable=int(config.workers) <= 1)
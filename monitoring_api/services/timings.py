@@ -0,0 +1,86 @@
+#!/usr/bin/python3
+
+from bisect import bisect_left
+from typing import Any, Dict, List, Optional
+
+# Inclusive upper bounds in milliseconds of the histogram buckets, one more bucket holds everything above
+BOUNDS_MS = [0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000]
+
+QUANTILES = {"p50_ms": 0.5, "p90_ms": 0.9, "p99_ms": 0.99}
+
+
+class Histogram:
+    """Fixed bucket latency histogram with count, error count, sum, min and max."""
+    __slots__ = ("counts", "count", "errors", "total", "min", "max")
+
+    def __init__(self) -> None:
+        self.counts = [0] * (len(BOUNDS_MS) + 1)
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+
+    def record(self, ms: float, error: bool = False) -> None:
+        """Add one duration in milliseconds."""
+        self.counts[bisect_left(BOUNDS_MS, ms)] += 1
+        self.count += 1
+        self.total += ms
+        if ms > self.max:
+            self.max = ms
+        if ms < self.min:
+            self.min = ms
+        if error:
+            self.errors += 1
+
+    def quantile(self, q: float) -> float:
+        """Estimate a quantile by interpolating inside the bucket it falls in, within the observed range."""
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = BOUNDS_MS[index - 1] if index > 0 else 0.0
+                upper = BOUNDS_MS[index] if index < len(BOUNDS_MS) else self.max
+                return min(max(lower + (upper - lower) * (rank - seen) / count, self.min), self.max)
+            seen += count
+        return self.max
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return the summary of the histogram, rounded for display."""
+        result: Dict[str, Any] = {"count": self.count, "errors": self.errors}
+        if self.count:
+            result["avg_ms"] = round(self.total / self.count, 3)
+            for key, q in QUANTILES.items():
+                result[key] = round(self.quantile(q), 3)
+            result["max_ms"] = round(self.max, 3)
+        return result
+
+
+class Timings:
+    """
+    Named latency histograms for checks, authentication, logins and JSON
+    encoding. Recording is a dict lookup plus a bisect, so it can wrap hot
+    paths. Records come from the event loop thread only.
+    """
+
+    def __init__(self) -> None:
+        self.histograms: Dict[str, Histogram] = {}
+
+    def record(self, name: str, ms: float, error: bool = False) -> None:
+        """Add one duration in milliseconds to the histogram of name."""
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram()
+        histogram.record(ms, error)
+
+    def snapshot(self, prefix: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+        """Return the summary of every histogram, or of those whose name starts with prefix."""
+        names: List[str] = sorted(self.histograms)
+        return {
+            name[len(prefix):] if prefix else name: self.histograms[name].snapshot()
+            for name in names if prefix is None or name.startswith(prefix)
+        }
+
+
+# Global instance of Timings
+timings = Timings()
@@ -4,7 +4,7 @@ import aiohttp
 import json
 import time
 import traceback
-from typing import Optional, Union, Dict, Any
+from typing import Optional, Union, Dict, Any, Tuple
 from config import config
 from services.logger import logger
 
@@ -23,6 +23,8 @@ class Api:
         self.token = 0
         self.token_timestamp = 0
         self.base_url = f"http://{config.api_address}:{str(config.api_port)}"
+        # Last ETag and body per path, reused when the API answers 304 Not Modified
+        self.cache: Dict[str, Tuple[str, Union[Dict[str, Any], list]]] = {}
 
     async def token_check(self) -> Optional[bool]:
         """
@@ -66,15 +68,30 @@ class Api:
                 "Token check failed, couldn't verify or refresh token")
             return None
 
-        # Make the request
+        # Make a conditional request when we have a cached body for this path
+        headers = {'Authorization': f'Bearer {self.token}'}
+        cached = self.cache.get(path)
+        if cached:
+            headers['If-None-Match'] = cached[0]
+
         try:
             async with aiohttp.ClientSession() as session:
-                async with session.get(f"{self.base_url}/api/status/{path}", headers={'Authorization': f'Bearer {self.token}'}) as response:
+                async with session.get(f"{self.base_url}/api/status/{path}", headers=headers) as response:
+                    if response.status == 304 and cached:
+                        logger.debug(f"API GET for path /{path} not modified, using cached body")
+                        return cached[1]
+
                     if not response.ok:
                         logger.error(f"Not OK response for API GET, path: /{path}. Error: {response.status} - {response.reason} - {response.text}")
                         return None
 
-                    return await response.json()
+                    data = await response.json()
+                    etag = response.headers.get("ETag")
+                    if etag:
+                        self.cache[path] = (etag, data)
+                    else:
+                        self.cache.pop(path, None)
+                    return data
 
         except Exception as e:
             logger.error(f"Failed to get info for path {path}. Error: {str(e)}")
@@ -43,25 +43,27 @@ class Plex:
 
     async def create_status_message(self, json: Dict[str, Any]) -> str:
         """ Generates a formatted Telegram message with server status. """
-        json = json["plex"]
         intro_message = f"📺 *Plex Stream Status* 📺\n"
 
-        if json['response']['data']['stream_count'] == "0":
+        if json.get("error"):
+            return intro_message + escape_markdown(f"\nTautulli is not reachable: {json['error']}", version=2)
+
+        if not json.get("stream_count"):
             return f"{intro_message}\nNo current streams\."
 
-        message = f"Active Streams: {json['response']['data']['stream_count']}\n"
-        message += f"Total bandwidth: {json['response']['data']['total_bandwidth']}\n\n"
+        message = f"Active Streams: {json['stream_count']}\n"
+        message += f"Total bandwidth: {json.get('total_bandwidth', 0)}\n\n"
 
-        for session in json["response"]["data"]["sessions"]:
-            message += f"{session.get('username', 'Unknown User')} ({session.get('friendly_name', 'Unknown Device')})\n"
-            if session.get("library_name", "") == "TV Shows":
-                message += f"{session.get('full_title', 'Unknown Title')} (S{int(session.get('parent_media_index', '0')):02}E{int(session.get('media_index', '0')):02}) ({session.get('progress_percent', '0')}%)\n"
+        for session in json.get("sessions", []):
+            message += f"{session.get('username') or 'Unknown User'} ({session.get('friendly_name') or 'Unknown Device'})\n"
+            if session.get("library_name") == "TV Shows":
+                message += f"{session.get('full_title') or 'Unknown Title'} (S{session.get('parent_media_index') or 0:02}E{session.get('media_index') or 0:02}) ({session.get('progress_percent') or 0}%)\n"
             else:
-                message += f"{session.get('full_title', 'Unknown Title')}\n"
-            message += f"{session.get('platform', 'Unknown Platform')} ({session.get('device', 'Unknown Device')} - {session.get('ip_address_public', 'Unknown IP Address')})\n"
-            message += f"Bandwidth: {session.get('bandwidth', 'Unknown Bandwidth')}\n"
-            message += f"Quality: {session.get('quality_profile', 'Unknown Quality Profile')} - {session.get('video_full_resolution', 'Unknown Resolution')}\n"
-            message += f"State: {session.get('state', 'Unknown State')}\n\n"
+                message += f"{session.get('full_title') or 'Unknown Title'}\n"
+            message += f"{session.get('platform') or 'Unknown Platform'} ({session.get('device') or 'Unknown Device'} - {session.get('ip_address_public') or 'Unknown IP Address'})\n"
+            message += f"Bandwidth: {session.get('bandwidth') or 'Unknown Bandwidth'}\n"
+            message += f"Quality: {session.get('quality_profile') or 'Unknown Quality Profile'} - {session.get('video_full_resolution') or 'Unknown Resolution'}\n"
+            message += f"State: {session.get('state') or 'Unknown State'}\n\n"
 
         return intro_message + escape_markdown(message, version=2)
 
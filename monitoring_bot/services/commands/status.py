@@ -134,7 +134,9 @@ class Status:
                 json, "apt_updates", "total_updates")
             critical_updates = get_section_value(
                 json, "apt_updates", "critical_updates")
-            message += f"📦 *APT Updates:*\n \\- Total: `{total_updates}`\n \\- Critical: `{critical_updates}`\n\n"
+            held_updates = get_section_value(
+                json, "apt_updates", "held_updates")
+            message += f"📦 *APT Updates:*\n \\- Total: `{total_updates}`\n \\- Critical: `{critical_updates}`\n \\- Held: `{held_updates}`\n\n"
 
         # Load Average
         if type in ["all", "load"]:
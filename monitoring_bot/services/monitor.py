@@ -139,9 +139,9 @@ class Monitor:
 
             # Generates a formatted list
             exceeded = [
-                f"{name.replace('_', ' ').capitalize()}: {round(value, 2)}"
-                for name, value in data.items()
-                if float(value) > float(thresholds[name])
+                f"{name.replace('_', ' ').capitalize()}: {round(data[name], 2)}"
+                for name, threshold in thresholds.items()
+                if float(data[name]) > float(threshold)
             ]
 
             # Sets the alert variables accordingly